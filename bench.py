@@ -0,0 +1,183 @@
+# Headless benchmark of the dashboard's data pipeline (no browser, no
+# streamlit). Each stage of a rerun is timed on the real CSV and on copies
+# scaled up by repeating every town (or on generate_data.py output with
+# --synthetic), and its peak allocation is recorded.
+#
+#   python bench.py                         # 1x, 10x, 100x, 1000x
+#   python bench.py --scales 1 10 --json bench.json
+#   python bench.py --synthetic --scales 100 1000
+#   python bench.py --compare bench.json    # exit 1 if a stage got slower
+#   python bench.py --backends duckdb polars  # also time the query backends
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+import generate_data
+from pipeline import (
+    CSV_PATH,
+    EXISTENCE_LABELS,
+    QUERY_BACKENDS,
+    aggregate_governorates,
+    build_town_index,
+    existence_counts,
+    filter_agg,
+    filter_existence,
+    filter_towns,
+    filter_view,
+    forget_loaded,
+    load_frame,
+    open_source,
+    parse_csv,
+    v1_long,
+)
+
+SCALES = [1, 10, 100, 1000]
+TOP_N_GOV = 10  # the sidebar default
+BASE_ROWS = 1137  # towns in the real file, the 1x size for --synthetic
+
+
+def scaled_csv(src: Path, factor: int, out_dir: Path) -> Path:
+    # `factor` copies of every row, towns renamed "<town> #k" so they stay
+    # distinct; written copy by copy so the 1000x file never sits in memory
+    if factor == 1:
+        return src
+    raw = pd.read_csv(src, encoding="utf-8-sig", dtype=str)
+    out = out_dir / f"{src.stem} x{factor}.csv"
+    for k in range(factor):
+        part = raw.assign(Town=raw["Town"] + f" #{k}") if k else raw
+        part.to_csv(out, mode="a" if k else "w", header=not k, index=False)
+    return out
+
+
+def measure(fn, repeat: int) -> tuple:
+    # (result, best wall time in ms, peak traced allocation in MB); memory is
+    # traced in a separate call so tracemalloc overhead stays out of the times.
+    # tracemalloc only sees numpy/pandas allocations, not Arrow's own buffers.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(times), peak / 2**20
+
+
+def run_stages(csv_path: Path, cache_dir: Path, repeat: int, backends=()) -> list:
+    rows = []
+
+    def stage(name, fn):
+        result, ms, peak_mb = measure(fn, repeat)
+        rows.append({"stage": name, "ms": round(ms, 3), "peak_mb": round(peak_mb, 3)})
+        return result
+
+    df = stage("load_data (csv)", lambda: parse_csv(csv_path))
+    load_frame(csv_path, cache_dir)  # write the snapshot once
+    stage("load_data (snapshot)", lambda: load_frame(csv_path, cache_dir))
+    gov_agg = stage("governorate aggregate", lambda: aggregate_governorates(df))
+
+    sel_govs = sorted(df["Governorate"].unique().tolist())
+    agg = stage("filter & agg", lambda: filter_agg(gov_agg, sel_govs, TOP_N_GOV))
+    top_govs = tuple(agg["Governorate"].tolist())
+    dff = stage("filter towns", lambda: filter_towns(df, top_govs))
+
+    stage("visual 1 melt (split, %)", lambda: v1_long(agg, True, True))
+    stage("visual 1 melt (total, abs)", lambda: v1_long(agg, False, False))
+    exist_all = stage("existence counts (all towns)", lambda: existence_counts(df))
+    stage("visual 3 existence slice", lambda: filter_existence(exist_all, top_govs))
+
+    town_index = stage("drill-down index", lambda: build_town_index(df))
+    keys = [(gov, label) for gov in top_govs for label in EXISTENCE_LABELS.values()]
+    stage("drill-down lookups (all)", lambda: [town_index.get(k, ()) for k in keys])
+
+    # everything a filter change recomputes, against what copying the
+    # filtered towns would cost (slice_mb; tests/test_rerun_memory.py holds
+    # the rerun to a fraction of it)
+    def rerun():
+        agg, govs, _ = filter_view(gov_agg, exist_all, sel_govs, TOP_N_GOV)
+        v1_long(agg, True, True)
+        return [town_index.get((gov, label), ()) for gov in govs for label in EXISTENCE_LABELS.values()]
+
+    stage("rerun (filters -> visuals)", rerun)
+    rows[-1]["slice_mb"] = round(dff.memory_usage(deep=True).sum() / 2**20, 3)
+
+    # the engines' own (native) memory is invisible to tracemalloc
+    for name in backends:
+        options = {"cache_dir": cache_dir} if name == "pandas" else {}
+
+        def open_fresh():
+            forget_loaded(csv_path)  # time the load, not load_incremental's memo
+            return open_source(name, [csv_path], **options)
+
+        source = stage(f"{name} open", open_fresh)
+        stage(f"{name} governorate aggregate", source.gov_agg)
+        stage(f"{name} existence counts", source.existence_counts)
+        stage(f"{name} existence counts (top N)", lambda: source.existence_counts(top_govs))
+        stage(f"{name} drill-down lookup", lambda: source.towns(top_govs[0], "Commerce"))
+    return rows
+
+
+def compare(results: list, baseline: list, tolerance: float, floor_ms: float) -> list:
+    # stages slower than tolerance x baseline (ignoring sub-floor timings)
+    base = {(r["scale"], r["stage"]): r["ms"] for r in baseline}
+    slower = []
+    for r in results:
+        before = base.get((r["scale"], r["stage"]))
+        if before is not None and r["ms"] > floor_ms and r["ms"] > before * tolerance:
+            slower.append((r, before))
+    return slower
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard data pipeline.")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH)
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--synthetic", action="store_true",
+                        help="use generated towns instead of copies of the real ones")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=[], choices=sorted(QUERY_BACKENDS),
+                        help="also time these query backends")
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    parser.add_argument("--compare", type=Path, help="baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor")
+    parser.add_argument("--floor-ms", type=float, default=5.0, help="ignore stages faster than this")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for factor in args.scales:
+            if args.synthetic:
+                csv_path = generate_data.write(tmp / f"synthetic x{factor}.csv", BASE_ROWS * factor)
+            else:
+                csv_path = scaled_csv(args.csv, factor, tmp)
+            with open(csv_path, "rb") as f:
+                n_rows = sum(1 for _ in f) - 1
+            print(f"\n== {factor}x ({n_rows:,} towns, {csv_path.stat().st_size / 2**20:,.1f} MB)")
+            print(f"{'stage':<30}{'best ms':>12}{'peak MB':>12}")
+            for row in run_stages(csv_path, tmp / f"cache-{factor}", args.repeat, args.backends):
+                row.update(scale=factor, rows=n_rows)
+                results.append(row)
+                print(f"{row['stage']:<30}{row['ms']:>12,.2f}{row['peak_mb']:>12,.2f}")
+
+    failed = False
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        slower = compare(results, json.loads(args.compare.read_text()), args.tolerance, args.floor_ms)
+        for r, before in slower:
+            print(f"REGRESSION {r['scale']}x {r['stage']}: {before:,.2f} ms -> {r['ms']:,.2f} ms")
+        failed = failed or bool(slower)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,55 +1,49 @@
+import functools
+import inspect
+import logging
+import os
+import uuid
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
-from PIL import Image
-
-# show image in sidebar
-st.sidebar.image("streamlit_pic.png", use_container_width=True)
 
+from pipeline import (
+    COMMERCIAL_SIZE_COLS,
+    SingleFlight,
+    TownLookup,
+    combine_existence_counts,
+    combine_gov_aggs,
+    drop_source,
+    existence_delta,
+    file_stamp,
+    filter_view,
+    gov_agg_delta,
+    query_source,
+    v1_long,
+    webp_thumbnail,
+)
+import shared_cache
+from timing import StageTimer, env_enabled
+from watcher import THREAD_NAME, DataWatcher, env_interval
 
 st.set_page_config(page_title="Lebanon Commercial,Service & Non-Banking Financial Institutions, by Governorate", layout="wide")
 
-# === PATH TO CSV =============================================================
-CSV_PATH = Path(__file__).parent / "Cleaned Data.csv"
-
-# === COLUMN SETS =============================================================
-COMMERCIAL_SIZE_COLS = [
-    "Total number of commercial institutions by size - number of small institutions",
-    "Total number of commercial institutions by size - number of medium-sized institutions",
-    "Total number of commercial institutions by size - number of large-sized institutions",
-]
-OTHER_COLS = [
-    "Total number of service institutions",
-    "Total number of non banking financial institutions",
-]
-EXISTENCE_COLS = [
-    "Existence of commercial and service activities by type - self employment",
-    "Existence of commercial and service activities by type - public sector",
-    "Existence of commercial and service activities by type - banking institutions",
-    "Existence of commercial and service activities by type - service institutions",
-    "Existence of commercial and service activities by type - commerce",
-]
-EXISTENCE_LABELS = {
-    EXISTENCE_COLS[0]: "Self-employment",
-    EXISTENCE_COLS[1]: "Public sector",
-    EXISTENCE_COLS[2]: "Banking",
-    EXISTENCE_COLS[3]: "Service institutions",
-    EXISTENCE_COLS[4]: "Commerce",
-}
+# === PATHS ===================================================================
+# Sidebar picture: the PNG is only the source, a downscaled WebP is served
+IMAGE_PATH = Path(__file__).parent / "streamlit_pic.png"
+SIDEBAR_IMAGE_WIDTH = 600  # ~2x the sidebar width, still sharp on HiDPI screens
 
-# legend mapping for Visual 1
-SIZE_MAP = {
-    COMMERCIAL_SIZE_COLS[0]: "Commercial — Small",
-    COMMERCIAL_SIZE_COLS[1]: "Commercial — Medium",
-    COMMERCIAL_SIZE_COLS[2]: "Commercial — Large",
-}
-OTHER_MAP = {
-    "Total number of service institutions": "Service institutions",
-    "Total number of non banking financial institutions": "Non-banking financial institutions",
-}
+TOP_N_DEFAULT = 10  # sidebar default, also what the watcher pre-builds
+AGGREGATE_CACHE_ENTRIES = 64  # combined aggregate tables: a few KB each
+SOURCES_CACHE_ENTRIES = 16  # drill-down provenance tables: long strings
 
-# colors
+# The engine behind every query source (pipeline.QUERY_BACKENDS): "pandas"
+# (default) loads each partition into memory, "duckdb" and "polars" answer the
+# same questions with their own engines and never build a pandas frame
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas").strip().lower()
+
+# === COLORS ==================================================================
 COLOR_MAP_V1 = {
     "Commercial — Small": "#1f77b4",    # dark blue
     "Commercial — Medium": "#3399e6",   # medium blue
@@ -68,109 +62,143 @@ COLOR_MAP_V3 = {
 V3_ACTIVITY_ORDER = ["Commerce", "Service institutions", "Self-employment", "Public sector", "Banking"]
 
 # === LOAD & PREP =============================================================
-@st.cache_data
-def load_data(csv_path: str) -> pd.DataFrame:
-    df = pd.read_csv(csv_path, encoding="utf-8-sig")
-    df.columns = [c.strip() for c in df.columns]
+@st.cache_resource
+def shared_results():
+    # cross-replica cache under the st.cache_* layer; None unless configured
+    return shared_cache.from_env()
 
-    def clean_area(x: str) -> str:
-        s = str(x)
-        if "/" in s:
-            s = s.rsplit("/", 1)[-1]
-        s = s.replace("-", " ").replace("_", " ").strip().title()
-        if "Governorate" not in s and "District" not in s:
-            s = f"{s} Governorate"
-        return s
 
-    df["Governorate"] = df["refArea"].apply(clean_area)
+def shared(kind: str, key: tuple, build):
+    # `build()`, through the shared cache when there is one
+    cache = shared_results()
+    return build() if cache is None else cache.get_or_build(kind, key, build)
 
-    for col in COMMERCIAL_SIZE_COLS + OTHER_COLS:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
 
-    # Keeping NaN as NaN to reflect “no data”
-    for col in EXISTENCE_COLS:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+@st.cache_resource
+def filter_results():
+    # bounded (bytes + entries, LRU/LFU) cache for the results that depend on
+    # the sidebar filters, whose number of combinations has no useful bound
+    return shared_cache.filter_cache_from_env()
 
-    return df
 
-df = load_data(CSV_PATH)
+def filter_cached(kind: str):
+    # memoize in filter_results(), then the shared cache, keyed like
+    # st.cache_data would: on every argument but the unhashed (_-prefixed) frames
+    def decorate(fn):
+        signature = inspect.signature(fn)
 
-st.title("Lebanon Trade 2023")
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (fn.__name__,) + tuple(v for k, v in bound.arguments.items() if not k.startswith("_"))
+            return filter_results().get_or_build(
+                kind, key, lambda: shared(kind, key, lambda: fn(*args, **kwargs))
+            )
 
-# === SIDEBAR ================================================================
-with st.sidebar:
-    st.header("Filters")
-    govs = sorted(df["Governorate"].unique().tolist())
-    sel_govs = st.multiselect("Governorates", govs, default=govs)
+        return wrapper
 
-    top_n_gov = st.slider("Top N governorates (by total institutions)", 5, 25, 10, step=1)
+    return decorate
 
-    st.markdown("---")
-    show_pct_comm = st.toggle("Show % within governorate (100% stacked)", value=True)
-    split_commercial = st.checkbox("Split Commercial into Small / Medium / Large", value=True)
 
+def load_source(csv_path, stamp: tuple = None):
+    # the query source (pipeline.QUERY_BACKENDS) of one partition file: one
+    # per file version and process (see query_source). With pandas it
+    # holds the read-only frame every session reads as-is (see freeze), and
+    # the frames go through the shared cache like the figures do.
+    options = {"shared": shared_results()} if BACKEND == "pandas" else {}
+    return query_source(BACKEND, csv_path, stamp, **options)
 
-# === FILTER & AGG (for V1 & V2) =============================================
-dff = df[df["Governorate"].isin(sel_govs)].copy()
-
-agg = dff.groupby("Governorate", as_index=False)[COMMERCIAL_SIZE_COLS + OTHER_COLS].sum()
-agg["Commercial (total)"] = agg[COMMERCIAL_SIZE_COLS].sum(axis=1)
-agg["All total"] = (
-    agg["Commercial (total)"]
-    + agg["Total number of service institutions"]
-    + agg["Total number of non banking financial institutions"]
-)
-agg = agg.sort_values("All total", ascending=False).head(top_n_gov)
-
-dff = dff[dff["Governorate"].isin(agg["Governorate"].tolist())].copy()
 
-
-# === VISUAL 1 ================================================================
-st.subheader("Lebanon Commercial, Service & Non-Banking Financial Institutions, by Governorate")
-
-if split_commercial:
-    cols_to_use = COMMERCIAL_SIZE_COLS + OTHER_COLS
-    long_v1 = agg.melt(id_vars="Governorate", value_vars=cols_to_use, var_name="Raw", value_name="Value")
-    long_v1["Series"] = long_v1["Raw"].map({**SIZE_MAP, **OTHER_MAP})
-    series_order = ["Commercial — Small", "Commercial — Medium", "Commercial — Large",
-                    "Service institutions", "Non-banking financial institutions"]
-else:
-    tmp = agg[["Governorate", "Commercial (total)"] + OTHER_COLS].copy()
-    tmp = tmp.rename(columns={"Commercial (total)": "Commercial"})
-    long_v1 = tmp.melt(id_vars="Governorate", value_vars=["Commercial"] + OTHER_COLS,
-                       var_name="Series", value_name="Value")
-    long_v1["Series"] = long_v1["Series"].replace({
-        "Commercial": "Commercial (total)",
-        "Total number of service institutions": "Service institutions",
-        "Total number of non banking financial institutions": "Non-banking financial institutions",
-    })
-    series_order = ["Commercial (total)", "Service institutions", "Non-banking financial institutions"]
-
-if show_pct_comm:
-    long_v1["RowSum"] = long_v1.groupby("Governorate")["Value"].transform(lambda s: max(s.sum(), 1))
-    long_v1["Value"] = (long_v1["Value"] / long_v1["RowSum"]) * 100
-    y_title = "Percent of institutions (%)"
-else:
-    y_title = "Number of institutions"
-
-fig_v1 = px.bar(
-    long_v1, x="Governorate", y="Value", color="Series",
-    barmode="stack",
-    category_orders={"Series": series_order},
-    color_discrete_map=COLOR_MAP_V1,
-    hover_data={"Governorate": True, "Series": True, "Value": ":,.2f"},
-)
-fig_v1.update_layout(xaxis_title="", yaxis_title=y_title, legend_title="", margin=dict(l=10, r=10, t=10, b=10), height=460)
-st.plotly_chart(fig_v1, use_container_width=True)
+@st.cache_data
+def load_gov_agg(csv_path: str, stamp: tuple = None) -> pd.DataFrame:
+    return load_source(csv_path, stamp).gov_agg()
 
 
-# === VISUAL 2 ================================================================
-st.subheader("Institution Composition within a Governorate")
-if agg.empty:
-    st.warning("No data for current filters.")
-else:
-    focus_gov = st.selectbox("Choose a governorate to inspect", agg["Governorate"].tolist())
-    row = agg[agg["Governorate"] == focus_gov].iloc[0]
+@st.cache_data
+def load_existence_agg(csv_path: str, stamp: tuple = None) -> pd.DataFrame:
+    return load_source(csv_path, stamp).existence_counts()
+
+
+# Selected partitions: each file is aggregated through its own cache entries
+# above; only the (cheap) combination is keyed on the whole selection.
+@st.cache_data(max_entries=AGGREGATE_CACHE_ENTRIES)
+def load_selection_gov_agg(parts: tuple, stamp: tuple) -> pd.DataFrame:
+    return combine_gov_aggs([load_gov_agg(p.path, s) for p, s in zip(parts, stamp)])
+
+
+@st.cache_data(max_entries=AGGREGATE_CACHE_ENTRIES)
+def load_selection_existence(parts: tuple, stamp: tuple) -> pd.DataFrame:
+    return combine_existence_counts([load_existence_agg(p.path, s) for p, s in zip(parts, stamp)])
+
+
+@st.cache_data(max_entries=AGGREGATE_CACHE_ENTRIES)
+def load_year_delta(before: tuple, after: tuple, stamp: tuple) -> tuple:
+    # (governorate delta, existence delta) between the partitions of two years,
+    # from the stored per-partition aggregates only
+    stamps = dict(zip(before + after, stamp))
+    gov = [combine_gov_aggs([load_gov_agg(p.path, stamps[p]) for p in ps]) for ps in (before, after)]
+    exist = [combine_existence_counts([load_existence_agg(p.path, stamps[p]) for p in ps]) for ps in (before, after)]
+    return gov_agg_delta(*gov), existence_delta(*exist)
+
+
+@st.cache_resource
+def sidebar_image(src: Path, stamp: tuple) -> str:
+    # built once per source version, then reused by every session and rerun
+    return webp_thumbnail(src, SIDEBAR_IMAGE_WIDTH, stamp)
+
+
+@st.cache_data(max_entries=SOURCES_CACHE_ENTRIES)
+def load_sources(csv_path: str, stamp: tuple, gov: str, label: str) -> pd.DataFrame:
+    # the provenance rows behind one drill-down list
+    return load_source(csv_path, stamp).sources(gov, label)
+
+
+@st.cache_resource
+def cold_loads() -> SingleFlight:
+    # one per process: sessions that ask for the same selection while it is
+    # loading wait for that one load (and see its error) instead of starting
+    # their own parse
+    return SingleFlight()
+
+
+def load_view(parts: tuple, stamp: tuple, timer: StageTimer = None) -> tuple:
+    # (governorate aggregate, town lookup) of the selected partitions
+    timer = timer or StageTimer(False)
+    with timer.stage("load_data"):
+        sources = [load_source(p.path, s) for p, s in zip(parts, stamp)]
+    with timer.stage("governorate aggregate"):
+        gov_agg = load_selection_gov_agg(parts, stamp)
+    return gov_agg, TownLookup(*sources)
+
+
+# === FIGURE BUILDERS ==========================================================
+# Each visual is built from its own inputs only and memoized on them, so
+# touching one widget does not rebuild the figures of the other sections.
+# Frames passed with a leading underscore are not hashed: they are fully
+# determined by the data stamp and the other (hashed) arguments.
+@filter_cached("figure")
+def build_fig_v1(_agg: pd.DataFrame, stamp: tuple, govs: tuple, show_pct_comm: bool, split_commercial: bool,
+                 delta_years: tuple = ()):
+    # delta_years = (from, to): _agg holds the change between the two years
+    long_v1, series_order, y_title = v1_long(_agg, show_pct_comm and not delta_years, split_commercial)
+    if delta_years:
+        y_title = f"Change in institutions, {delta_years[0]} → {delta_years[1]}"
+
+    fig_v1 = px.bar(
+        long_v1, x="Governorate", y="Value", color="Series",
+        barmode="relative" if delta_years else "stack",
+        category_orders={"Series": series_order},
+        color_discrete_map=COLOR_MAP_V1,
+        hover_data={"Governorate": True, "Series": True, "Value": ":,.2f"},
+    )
+    fig_v1.update_layout(xaxis_title="", yaxis_title=y_title, legend_title="", margin=dict(l=10, r=10, t=10, b=10), height=460)
+    return fig_v1
+
+
+@filter_cached("figure")
+def build_fig_comp(_gov_agg: pd.DataFrame, stamp: tuple, focus_gov: str):
+    row = _gov_agg[_gov_agg["Governorate"] == focus_gov].iloc[0]
     values_pie = {
         "Commercial — Small": row[COMMERCIAL_SIZE_COLS[0]],
         "Commercial — Medium": row[COMMERCIAL_SIZE_COLS[1]],
@@ -182,135 +210,302 @@ else:
     fig_comp = px.pie(pie_df, names="Category", values="Value", hole=0.3,
                       color="Category", color_discrete_map=COLOR_MAP_V1)
     fig_comp.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=420)
-    st.plotly_chart(fig_comp, use_container_width=True)
+    return fig_comp
+
+
+@filter_cached("figure")
+def build_fig_exist(_exist_counts: pd.DataFrame, stamp: tuple, govs: tuple, delta_years: tuple = (),
+                    town_years: bool = False):
+    # town_years: the counts span several years, where a town counts once per year
+    unit = "town-years" if town_years else "towns"
+    y_title_exist = f"# {unit} with activity"
+    if delta_years:
+        y_title_exist = f"Change in # towns with activity, {delta_years[0]} → {delta_years[1]}"
+
+    # Stacked columns (one column per governorate)
+    fig_exist = px.bar(
+        _exist_counts,
+        x="Governorate",
+        y="Value",
+        color="Activity",
+        barmode="relative" if delta_years else "stack",
+        category_orders={"Activity": V3_ACTIVITY_ORDER},
+        color_discrete_map=COLOR_MAP_V3,
+        hover_data={
+            "Governorate": True,
+            "Activity": True,
+            "Value": ":,.2f",
+            "NumTowns": True,
+            "Denom": True,
+        },
+        labels={"NumTowns": f"{unit.capitalize()} with activity", "Denom": f"{unit.capitalize()} with data"}
+        if town_years else None,
+    )
+    fig_exist.update_layout(
+        xaxis_title="",
+        yaxis_title=y_title_exist,
+        legend_title="",
+        margin=dict(l=10, r=10, t=10, b=10),
+        height=460,
+    )
+    return fig_exist
+
+
+# === WATCHER =================================================================
+# A background thread (watcher.py) notices changed data files and runs
+# warm_defaults before publishing their new stamps: by the time a session
+# keys its loads on the new version, the default view is already cached.
+def default_parts(partitions) -> tuple:
+    # the sidebar's default selection: every dataset of the latest year
+    if len(partitions) <= 1:
+        return tuple(partitions)
+    latest = max(p.year for p in partitions)
+    return tuple(p for p in partitions if p.year == latest)
+
+
+def warm_defaults(partitions: tuple, stamps: dict) -> None:
+    # the same calls (and cache keys) as a first visit with the default filters
+    parts = default_parts(partitions)
+    if not parts:
+        return
+    stamp = tuple(stamps[p] for p in parts)
+    gov_agg, _ = cold_loads().do((parts, stamp), lambda: load_view(parts, stamp))
+    agg, top_govs, exist_counts = filter_view(
+        gov_agg, load_selection_existence(parts, stamp), sorted(gov_agg["Governorate"].tolist()), TOP_N_DEFAULT
+    )
+    build_fig_v1(agg, stamp, top_govs, True, True, ())
+    build_fig_exist(exist_counts, stamp, top_govs, ())
+    if top_govs:
+        build_fig_comp(gov_agg, stamp, top_govs[0])
+
+
+def release_versions(old: tuple, new: tuple) -> None:
+    # drop the per-file entries of every file the new version changed or
+    # removed, so a process keeps one version of each file, not every
+    # version it ever served (query_source keeps a changed file's previous
+    # source for the sessions still on it; a removed file's is dropped here)
+    (old_partitions, old_stamps), (_, new_stamps) = old, new
+    for p in old_partitions:
+        stamp = old_stamps[p]
+        if new_stamps.get(p) == stamp:
+            continue
+        for loader in (load_gov_agg, load_existence_agg):
+            loader.clear(p.path, stamp)
+        if p not in new_stamps:
+            drop_source(BACKEND, p.path)
+
+
+@st.cache_resource
+def data_watcher() -> DataWatcher:
+    # one per process, shared by every session. The thread calls the cached
+    # loaders outside any script run, which streamlit warns about on each call:
+    # those warnings are dropped for that thread only.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: record.threadName != THREAD_NAME
+    )
+    return DataWatcher(warm_defaults, env_interval(), release=release_versions).start()
+
+
+# === TIMING (opt-in: DASHBOARD_TIMING=1 or ?timing=1) =======================
+if "timing_session" not in st.session_state:
+    st.session_state["timing_session"] = uuid.uuid4().hex[:8]
+timer = StageTimer(
+    env_enabled() or st.query_params.get("timing") == "1",
+    session=st.session_state["timing_session"],
+)
 
+# === SIDEBAR ================================================================
+# show image in sidebar
+st.sidebar.image(sidebar_image(IMAGE_PATH, file_stamp(IMAGE_PATH)), use_container_width=True)
 
-# === VISUAL 3: ACTIVITY EXISTENCE (stacked, 1 column per governorate) ========
-st.subheader("Distribution of Activities Existence Across Governorates (by Number of Towns)")
+# Which year / dataset partitions to load; only shown when there is a choice.
+# Partitions and stamps are the watcher's last warmed version, not the disk's.
+partitions, stamps = data_watcher().published()
+with st.sidebar:
+    st.header("Filters")
+    if len(partitions) > 1:
+        parts = tuple(st.multiselect(
+            "Datasets",
+            partitions,
+            default=list(default_parts(partitions)),
+            format_func=lambda p: p.label,
+        ))
+    else:
+        parts = tuple(partitions)
+
+if not parts:
+    st.warning("Select at least one dataset.")
+    st.stop()
+
+# one file stamp per selected partition: a changed file means a fresh load
+data_stamp = tuple(stamps[p] for p in parts)
+gov_agg, town_index = cold_loads().do((parts, data_stamp), lambda: load_view(parts, data_stamp, timer))
+
+years = sorted({p.year for p in parts})
+# the per-partition town counts are summed: over several years, town-years
+town_years = len(years) > 1
+st.title(f"Lebanon Trade {', '.join(map(str, years))}")
+
+with st.sidebar:
+    govs = sorted(gov_agg["Governorate"].tolist())  # every governorate with towns
+    sel_govs = st.multiselect("Governorates", govs, default=govs)
 
-# Work on a copy with only the needed cols
-exist = dff[["Governorate", "Town"] + EXISTENCE_COLS].copy()
+    top_n_gov = st.slider("Top N governorates (by total institutions)", 5, 25, TOP_N_DEFAULT, step=1)
 
-# Keep NaN as NaN; convert to numeric for safety
-for col in EXISTENCE_COLS:
-    exist[col] = pd.to_numeric(exist[col], errors="coerce")
+    st.markdown("---")
+    show_pct_comm = st.toggle("Show % within governorate (100% stacked)", value=True)
+    split_commercial = st.checkbox("Split Commercial into Small / Medium / Large", value=True)
 
-# Long form to compute counts robustly
-exist_long = exist.melt(
-    id_vars=["Governorate", "Town"],
-    value_vars=EXISTENCE_COLS,
-    var_name="ActivityRaw",
-    value_name="Val",
-)
+    # Year-over-year mode for Visual 1 and 3 (needs at least two years)
+    all_years = sorted({p.year for p in partitions})
+    delta_years = ()
+    if len(all_years) > 1:
+        st.markdown("---")
+        if st.toggle("Compare two years (change per governorate)", value=False):
+            y_from = st.selectbox("From year", all_years, index=len(all_years) - 2)
+            y_to = st.selectbox("To year", all_years, index=len(all_years) - 1)
+            if y_from != y_to:
+                delta_years = (y_from, y_to)
 
-# Numerator: towns with activity present (Val == 1)
-exist_long["IsOne"] = (exist_long["Val"] == 1).astype(int)
-abs_counts = (
-    exist_long.groupby(["Governorate", "ActivityRaw"])["IsOne"]
-    .sum()
-    .reset_index(name="NumTowns")
-)
 
-# Denominator: towns that actually have data for that activity (non-null)
-den_counts = (
-    exist_long.groupby(["Governorate", "ActivityRaw"])["Val"]
-    .count()  # counts non-null
-    .reset_index(name="Denom")
-)
+# === FILTER & AGG (for V1 & V2) =============================================
+with timer.stage("existence counts"):
+    selection_exist = load_selection_existence(parts, data_stamp)
+with timer.stage("filter & agg"):
+    # slices of the per-selection tables: no town rows are copied
+    agg, top_govs, exist_counts = filter_view(gov_agg, selection_exist, sel_govs, top_n_gov)
+
+# In compare mode Visual 1 and 3 show after - before for the two chosen years
+# (all datasets of each year); Visual 2 and the drill-down keep the selection.
+v1_agg, v1_govs, v3_counts, v_stamp = agg, top_govs, exist_counts, data_stamp
+if delta_years:
+    with timer.stage("year-over-year"):
+        before = tuple(p for p in partitions if p.year == delta_years[0])
+        after = tuple(p for p in partitions if p.year == delta_years[1])
+        v_stamp = tuple(stamps[p] for p in before + after)
+        gov_delta, exist_delta = load_year_delta(before, after, v_stamp)
+        v1_agg, v1_govs, v3_counts = filter_view(gov_delta, exist_delta, sel_govs, top_n_gov)
+
+# Every section below is a fragment: its own widgets rerun only that section,
+# while the sidebar filters still rerun the whole page. Upstream data comes in
+# as arguments from the cached loaders above.
 
-# Merge numerator & denominator
-exist_counts = abs_counts.merge(den_counts, on=["Governorate", "ActivityRaw"], how="left")
 
-# Map clean labels
-exist_counts["Activity"] = exist_counts["ActivityRaw"].map(EXISTENCE_LABELS)
+# === VISUAL 1 ================================================================
+@st.fragment
+def visual_1(agg: pd.DataFrame, stamp: tuple, top_govs: tuple, show_pct_comm: bool, split_commercial: bool,
+             delta_years: tuple, timer: StageTimer):
+    timer = timer.for_fragment()
+    st.subheader("Lebanon Commercial, Service & Non-Banking Financial Institutions, by Governorate")
 
-# Top-N by “# towns with data” (largest Denom across activities)
-gov_rank = (
-    exist_counts.groupby("Governorate")["Denom"]
-    .max()
-    .sort_values(ascending=False)
-    .index.tolist()
-)
-exist_counts = exist_counts[exist_counts["Governorate"].isin(gov_rank)]
+    with timer.stage("visual 1 figure"):
+        fig_v1 = build_fig_v1(agg, stamp, top_govs, show_pct_comm, split_commercial, delta_years)
+    with timer.stage("visual 1 plotly_chart"):
+        st.plotly_chart(fig_v1, use_container_width=True)
 
-# Percent or absolute
-exist_counts["Value"] = exist_counts["NumTowns"]
-y_title_exist = "# towns with activity"
 
-# --- Colors (your request): pink, red, dark blue, clear blue, medium blue ---
-activity_order = ["Commerce", "Service institutions", "Self-employment", "Public sector", "Banking"]
-exist_color_map = {
-    "Commerce":              "#f7a6b9",  # pink
-    "Service institutions":  "#e63946",  # red
-    "Self-employment":       "#0b3d91",  # dark blue
-    "Public sector":         "#74b9ff",  # clear/light blue
-    "Banking":               "#2e86de",  # medium blue
-}
+visual_1(v1_agg, v_stamp, v1_govs, show_pct_comm, split_commercial, delta_years, timer)
 
-# Stacked columns (one column per governorate)
-fig_exist = px.bar(
-    exist_counts,
-    x="Governorate",
-    y="Value",
-    color="Activity",
-    barmode="stack",
-    category_orders={"Activity": activity_order},
-    color_discrete_map=exist_color_map,
-    hover_data={
-        "Governorate": True,
-        "Activity": True,
-        "Value": ":,.2f",
-        "NumTowns": True,
-        "Denom": True,
-    },
-)
-fig_exist.update_layout(
-    xaxis_title="",
-    yaxis_title=y_title_exist,
-    legend_title="",
-    margin=dict(l=10, r=10, t=10, b=10),
-    height=460,
-)
-st.plotly_chart(fig_exist, use_container_width=True)
+
+# === VISUAL 2 ================================================================
+@st.fragment
+def visual_2(agg: pd.DataFrame, gov_agg: pd.DataFrame, stamp: tuple, timer: StageTimer):
+    timer = timer.for_fragment()
+    st.subheader("Institution Composition within a Governorate")
+    if agg.empty:
+        st.warning("No data for current filters.")
+    else:
+        focus_gov = st.selectbox("Choose a governorate to inspect", agg["Governorate"].tolist())
+        with timer.stage("visual 2 figure"):
+            fig_comp = build_fig_comp(gov_agg, stamp, focus_gov)
+        with timer.stage("visual 2 plotly_chart"):
+            st.plotly_chart(fig_comp, use_container_width=True)
 
 
+visual_2(agg, gov_agg, data_stamp, timer)
 
-# === DRILL DOWN (no change to the chart above) ===============================
-st.markdown("####  Name of towns inside a governorate")
-
-# Make sure the long table has clean Activity labels to filter on
-_exist_long = exist_long.copy()
-_exist_long["Activity"] = _exist_long["ActivityRaw"].map(EXISTENCE_LABELS)
-
-# Order governorates as they appear in your aggregated table
-gov_options = exist_counts["Governorate"].drop_duplicates().tolist()
-act_options = ["Commerce", "Service institutions", "Self-employment", "Public sector", "Banking"]
-
-c1, c2 = st.columns([1.2, 1])
-with c1:
-    dd_gov = st.selectbox("Governorate", gov_options, index=0)
-with c2:
-    dd_act = st.selectbox("Activity", act_options, index=0)
-
-# Build towns list for the chosen (gov, activity), value == 1
-towns_with_act = (
-    _exist_long[
-        (_exist_long["Governorate"] == dd_gov) &
-        (_exist_long["Activity"] == dd_act) &
-        (_exist_long["IsOne"] == 1)
-    ]["Town"]
-    .dropna()
-    .drop_duplicates()
-    .sort_values()
-    .tolist()
-)
 
-st.markdown(f"**Towns with _{dd_act}_ in _{dd_gov}_** — {len(towns_with_act)} town(s)")
-if towns_with_act:
-    # neat multi-column list (all towns, no Top-N)
-    cols = st.columns(4)
-    for i, t in enumerate(towns_with_act):
-        with cols[i % 4]:
-            st.markdown(f"- {t}")
-else:
-    st.info("No towns found with this activity == 1 for the selected governorate.")
+# === VISUAL 3: ACTIVITY EXISTENCE (stacked, 1 column per governorate) ========
+@st.fragment
+def visual_3(exist_counts: pd.DataFrame, stamp: tuple, top_govs: tuple, delta_years: tuple, town_years: bool,
+             timer: StageTimer):
+    timer = timer.for_fragment()
+    unit = "Town-Years" if town_years else "Towns"
+    st.subheader(f"Distribution of Activities Existence Across Governorates (by Number of {unit})")
+    if town_years:
+        st.caption("Counts are summed over the selected years: a town counts once for every year it appears in.")
+
+    with timer.stage("visual 3 figure"):
+        fig_exist = build_fig_exist(exist_counts, stamp, top_govs, delta_years, town_years)
+    with timer.stage("visual 3 plotly_chart"):
+        st.plotly_chart(fig_exist, use_container_width=True)
+
+
+visual_3(v3_counts, v_stamp, v1_govs, delta_years, town_years and not delta_years, timer)
+
+
+
+# === DRILL DOWN (no change to the chart above) ===============================
+@st.fragment
+def drill_down(parts: tuple, stamp: tuple, exist_counts: pd.DataFrame, town_index: TownLookup, timer: StageTimer):
+    timer = timer.for_fragment()
+    st.markdown("####  Name of towns inside a governorate")
+
+    # Order governorates as they appear in your aggregated table
+    gov_options = exist_counts["Governorate"].drop_duplicates().tolist()
+    act_options = ["Commerce", "Service institutions", "Self-employment", "Public sector", "Banking"]
+
+    c1, c2 = st.columns([1.2, 1])
+    with c1:
+        dd_gov = st.selectbox("Governorate", gov_options, index=0)
+    with c2:
+        dd_act = st.selectbox("Activity", act_options, index=0)
+
+    with timer.stage("drill-down"):
+        # Towns for the chosen (gov, activity), value == 1: precomputed at load time
+        towns_with_act = list(town_index.get((dd_gov, dd_act), ()))
+
+        count = f"{len(towns_with_act)} town(s)"
+        if len({p.year for p in parts}) > 1 and towns_with_act:
+            # the chart above counts each town once per year it has the activity
+            count += f", {town_index.count((dd_gov, dd_act))} town-years as in the chart above"
+        st.markdown(f"**Towns with _{dd_act}_ in _{dd_gov}_** — {count}")
+        if towns_with_act:
+            # neat multi-column list (all towns, no Top-N): one markdown block per
+            # column, so the element count stays at 4 however many towns there are
+            cols = st.columns(4)
+            for i, col in enumerate(cols):
+                col.markdown("\n".join(f"- {t}" for t in towns_with_act[i::4]))
+        else:
+            st.info("No towns found with this activity == 1 for the selected governorate.")
+
+    # Provenance columns are not part of the loaded frame; only read them on request
+    if towns_with_act and st.checkbox("Show source observations", value=False):
+        with timer.stage("provenance"):
+            sources = pd.concat(
+                [load_sources(p.path, s, dd_gov, dd_act) for p, s in zip(parts, stamp)], ignore_index=True
+            )
+        st.dataframe(sources.sort_values("Town"), hide_index=True, use_container_width=True)
+
+
+drill_down(parts, data_stamp, exist_counts, town_index, timer)
+
+
+# === TIMING PANEL ============================================================
+# Stages of this full run; fragment reruns only show up in the JSON log,
+# each under a run id of its own (StageTimer.for_fragment).
+timer.finish()
+if timer.enabled:
+    with st.expander(f"Timing — {timer.total_ms():,.1f} ms (run {timer.run})"):
+        timings = pd.DataFrame(timer.stages, columns=["Stage", "ms"])
+        st.dataframe(timings.style.format({"ms": "{:,.2f}"}), hide_index=True, use_container_width=True)
+        caches = {"Filter cache": filter_results(), "Shared cache": shared_results()}
+        for name, cache in caches.items():
+            if cache is None:
+                continue  # no shared cache configured
+            stats = cache.backend.stats()
+            st.caption(
+                f"{name} ({type(cache.backend).__name__}): {stats['entries']} entries, "
+                f"{stats['bytes'] / 2**20:,.1f} MB — "
+                f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions"
+            )
@@ -0,0 +1,138 @@
+# Optional DuckDB execution of the dashboard's aggregations
+# (DASHBOARD_BACKEND=duckdb). The CSV / Parquet partitions are queried with
+# SQL, so only the small result tables ever become pandas frames and extracts
+# far larger than pandas could hold still aggregate on all cores. Results
+# have the same columns and row order as their pandas counterparts in
+# pipeline.py (see QUERY BACKENDS there for the interface).
+import duckdb  # optional dependency: pip install duckdb
+import pandas as pd
+
+from pipeline import (
+    COMMERCIAL_SIZE_COLS,
+    EXISTENCE_COLS,
+    EXISTENCE_LABELS,
+    LOAD_COLS,
+    OTHER_COLS,
+    PROVENANCE_COLS,
+    TownLookup,
+    clean_area,
+)
+
+COUNT_COLS = COMMERCIAL_SIZE_COLS + OTHER_COLS
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _scan(paths: tuple) -> str:
+    # one relation over all the files, columns matched by name
+    files = [str(p) for p in paths]
+    listed = "[" + ", ".join(_literal(f) for f in files) + "]"
+    if all(f.endswith(".parquet") for f in files):
+        return f"read_parquet({listed}, union_by_name = true)"
+    if any(f.endswith(".parquet") for f in files):
+        raise ValueError("cannot mix CSV and Parquet partitions in one DuckDB source")
+    return f"read_csv({listed}, header = true, all_varchar = true, union_by_name = true)"
+
+
+class DuckDBSource:
+    # a `towns` view over the given files, cleaned the way parse_csv cleans:
+    # Governorate from clean_area, counts as numbers with 0 for blanks,
+    # existence flags as numbers with NULL for "no data"
+    def __init__(self, paths):
+        self.paths = tuple(paths)
+        self._con = duckdb.connect()
+        scan = _scan(self.paths)
+        columns = self._con.execute(f"DESCRIBE SELECT * FROM {scan}").df()["column_name"]
+        actual = {c.strip(): c for c in columns}  # headers may carry stray spaces
+        missing = [c for c in LOAD_COLS if c not in actual]
+        if missing:
+            raise KeyError(f"missing columns: {missing}")
+
+        # ~25 distinct areas: cleaned in Python, joined back in SQL (as a table:
+        # registered frames are not visible to the per-query cursors)
+        ref_area = _ident(actual["refArea"])
+        areas = self._con.execute(f"SELECT DISTINCT {ref_area} AS refArea FROM {scan}").df()["refArea"]
+        self._con.register("area_labels", pd.DataFrame({
+            "refArea": areas.astype(object),
+            "Governorate": [clean_area(a) for a in areas],
+        }))
+        self._con.execute("CREATE TABLE areas AS SELECT * FROM area_labels")
+        self._con.unregister("area_labels")
+
+        number = "TRY_CAST(t.{} AS DOUBLE)"
+        select = ["a.Governorate", f"t.{_ident(actual['Town'])} AS Town"]
+        select += [f"coalesce({number.format(_ident(actual[c]))}, 0) AS {_ident(c)}" for c in COUNT_COLS]
+        select += [f"{number.format(_ident(actual[c]))} AS {_ident(c)}" for c in EXISTENCE_COLS]
+        self.provenance = [c for c in PROVENANCE_COLS if c in actual]
+        select += [f"t.{_ident(actual[c])} AS {_ident(c)}" for c in self.provenance]
+        # Parquet is columnar already and is scanned per query; a CSV would be
+        # re-parsed every time, so it is loaded once into DuckDB's compressed
+        # columnar storage (which spills to disk instead of running out of memory)
+        kind = "VIEW" if scan.startswith("read_parquet") else "TABLE"
+        self._con.execute(
+            f"CREATE {kind} towns AS SELECT {', '.join(select)} FROM {scan} t "
+            f"LEFT JOIN areas a ON t.{ref_area} IS NOT DISTINCT FROM a.refArea"
+        )
+
+    def _query(self, sql: str, params=None) -> pd.DataFrame:
+        # a cursor per query: sessions run on their own threads
+        return self._con.cursor().execute(sql, params).df()
+
+    def gov_agg(self) -> pd.DataFrame:
+        sums = ", ".join(f"CAST(sum({_ident(c)}) AS BIGINT) AS {_ident(c)}" for c in COUNT_COLS)
+        agg = self._query(
+            f"SELECT Governorate, {sums}, count(*) AS Towns FROM towns GROUP BY Governorate ORDER BY Governorate"
+        )
+        agg.insert(len(COUNT_COLS) + 1, "Commercial (total)", agg[COMMERCIAL_SIZE_COLS].sum(axis=1))
+        agg.insert(len(COUNT_COLS) + 2, "All total", agg["Commercial (total)"] + agg[OTHER_COLS].sum(axis=1))
+        return agg.sort_values("All total", ascending=False, kind="stable").reset_index(drop=True)
+
+    def existence_counts(self, govs=None) -> pd.DataFrame:
+        # one pass for both counts of every activity, reshaped on the small result
+        where = ""
+        if govs is not None:
+            where = f"WHERE Governorate IN ({', '.join(_literal(g) for g in govs) or 'NULL'})"
+        sums = ", ".join(
+            f"count(*) FILTER (WHERE {_ident(c)} = 1) AS {_ident('NumTowns|' + c)}, "
+            f"count({_ident(c)}) AS {_ident('Denom|' + c)}"
+            for c in EXISTENCE_COLS
+        )
+        wide = self._query(f"SELECT Governorate, {sums} FROM towns {where} GROUP BY Governorate").set_index("Governorate")
+        wide.columns = pd.MultiIndex.from_tuples([tuple(c.split("|", 1)) for c in wide.columns])
+        counts = (
+            wide.stack(level=1, future_stack=True)
+            .rename_axis(["Governorate", "ActivityRaw"])
+            .reset_index()
+            .sort_values(["Governorate", "ActivityRaw"], ignore_index=True)
+        )
+        counts["Activity"] = counts["ActivityRaw"].map(EXISTENCE_LABELS)
+        counts["Value"] = counts["NumTowns"]
+        return counts
+
+    def towns(self, gov: str, label: str) -> tuple:
+        # sorted, de-duplicated towns of `gov` where the activity exists
+        col = {lab: c for c, lab in EXISTENCE_LABELS.items()}[label]
+        found = self._query(
+            f"SELECT DISTINCT Town FROM towns WHERE Governorate = ? AND {_ident(col)} = 1 "
+            f"AND Town IS NOT NULL ORDER BY Town",
+            [gov],
+        )
+        return tuple(found["Town"])
+
+    def sources(self, gov: str, label: str) -> pd.DataFrame:
+        # provenance of the rows behind towns(gov, label)
+        col = {lab: c for c, lab in EXISTENCE_LABELS.items()}[label]
+        cols = ", ".join(_ident(c) for c in ["Town"] + self.provenance)
+        return self._query(
+            f"SELECT {cols} FROM towns WHERE Governorate = ? AND {_ident(col)} = 1 ORDER BY Town",
+            [gov],
+        )
+
+    def town_lookup(self) -> TownLookup:
+        return TownLookup(self)
@@ -0,0 +1,162 @@
+# Synthetic inputs with exactly the "Cleaned Data.csv" schema, for sizing
+# and stress-testing the pipeline offline (see bench.py --synthetic).
+#
+#   python generate_data.py out.csv --rows 1000000
+#   python generate_data.py out.parquet --rows 200000 --years 2023 2024 2025
+#   python generate_data.py data --store --years 2024 2025   # partitioned store
+import argparse
+import sys
+from pathlib import Path
+from urllib.parse import quote_plus
+
+import numpy as np
+import pandas as pd
+
+from pipeline import COMMERCIAL_SIZE_COLS, EXISTENCE_COLS, OTHER_COLS, PROVENANCE_COLS, partition_path
+
+# column order of the real file
+SCHEMA = EXISTENCE_COLS + ["Town", "refArea"] + COMMERCIAL_SIZE_COLS + OTHER_COLS + PROVENANCE_COLS
+
+# refArea values as they appear in the real file (both the .../page/*_Governorate
+# and the .../resource/*_District forms, mojibake included) with their row counts
+AREAS = {
+    "https://dbpedia.org/page/Akkar_Governorate": 144,
+    "https://dbpedia.org/page/Mount_Lebanon_Governorate": 81,
+    "http://dbpedia.org/resource/Matn_District": 72,
+    "http://dbpedia.org/resource/Byblos_District": 67,
+    "https://dbpedia.org/page/Baalbek-Hermel_Governorate": 65,
+    "http://dbpedia.org/resource/Aley_District": 61,
+    "http://dbpedia.org/resource/Keserwan_District": 55,
+    "http://dbpedia.org/resource/Tyre_District": 54,
+    "https://dbpedia.org/page/South_Governorate": 51,
+    "http://dbpedia.org/resource/Sidon_District": 51,
+    "http://dbpedia.org/resource/Baabda_District": 45,
+    "http://dbpedia.org/resource/Miniyeh\u00e2\u0080\u0093Danniyeh_District": 43,
+    "https://dbpedia.org/page/North_Governorate": 40,
+    "https://dbpedia.org/page/Nabatieh_Governorate": 38,
+    "http://dbpedia.org/resource/Zgharta_District": 38,
+    "http://dbpedia.org/resource/Bint_Jbeil_District": 34,
+    "http://dbpedia.org/resource/Batroun_District": 33,
+    "http://dbpedia.org/resource/Zahl\u00c3\u00a9_District": 30,
+    "http://dbpedia.org/resource/Western_Beqaa_District": 29,
+    "http://dbpedia.org/resource/Marjeyoun_District": 28,
+    "https://dbpedia.org/page/Beqaa_Governorate": 26,
+    "http://dbpedia.org/resource/Bsharri_District": 20,
+    "http://dbpedia.org/resource/Hasbaya_District": 18,
+    "http://dbpedia.org/resource/Hermel_District": 9,
+    "http://dbpedia.org/resource/Tripoli_District,_Lebanon": 5,
+}
+
+# share of towns where each activity exists in the real file
+EXISTENCE_RATES = dict(zip(EXISTENCE_COLS, [0.635, 0.182, 0.080, 0.111, 0.434]))
+
+# institution counts are mostly zero with a long tail:
+# (share of zeros, lognormal median of the non-zero values, cap)
+COUNT_SHAPES = dict(zip(COMMERCIAL_SIZE_COLS + OTHER_COLS, [
+    (0.64, 12.0, 5000),
+    (0.83, 4.0, 200),
+    (0.92, 3.0, 200),
+    (0.92, 4.0, 300),
+    (0.94, 3.0, 230),
+]))
+
+OBSERVATION_BASE = "http://linked.aub.edu.lb/CODEC/Lebanon/observation/Trade-"
+DATASET_BASE = "http://linked.aub.edu.lb/CODEC/Lebanon/Dataset/Trade-Lebanon-"
+PUBLISHER = "Impact Open Data"
+REFERENCES = "https://impact.cib.gov.lb/home#open_data_section"
+BASE_YEAR = 2023
+
+
+def generate(rows: int, years=(BASE_YEAR,), nan_rate: float = 0.0, seed: int = 0, start: int = 0):
+    # yields one frame per year: `rows` towns (numbered from `start`), each
+    # keeping its area across years while the counts and flags are redrawn
+    rng = np.random.default_rng(seed)
+    areas = np.array(list(AREAS))
+    weights = np.array(list(AREAS.values()), dtype=float)
+    town_ids = np.arange(start, start + rows)
+    towns = pd.Series([f"Synthetic Town {i:07d}" for i in town_ids])
+    town_areas = areas[rng.choice(len(areas), size=rows, p=weights / weights.sum())]
+    quoted = towns.map(quote_plus)
+
+    for year in years:
+        frame = {}
+        for col in EXISTENCE_COLS:
+            flags = (rng.random(rows) < EXISTENCE_RATES[col]).astype(float)
+            flags[rng.random(rows) < nan_rate] = np.nan  # "no data"
+            frame[col] = flags
+        frame["Town"] = towns
+        frame["refArea"] = town_areas
+        for col in COMMERCIAL_SIZE_COLS + OTHER_COLS:
+            p_zero, median, cap = COUNT_SHAPES[col]
+            values = np.rint(rng.lognormal(np.log(median), 1.5, rows)).clip(1, cap)
+            values[rng.random(rows) < p_zero] = 0
+            frame[col] = values.astype(np.int64)
+        prefix = OBSERVATION_BASE if year == BASE_YEAR else f"{OBSERVATION_BASE}{year}-"
+        frame["Observation URI"] = prefix + quoted
+        frame["publisher"] = PUBLISHER
+        frame["dataset"] = f"{DATASET_BASE}{year}"
+        frame["references"] = REFERENCES
+
+        df = pd.DataFrame(frame, columns=SCHEMA)
+        # flags are written as 0/1/blank like the real file, not 0.0/1.0
+        df[EXISTENCE_COLS] = df[EXISTENCE_COLS].astype("Int8")
+        yield df
+
+
+def write(path: Path, rows: int, years=(BASE_YEAR,), nan_rate: float = 0.0,
+          seed: int = 0, chunk_rows: int = 250_000) -> Path:
+    # CSV or Parquet (by suffix), generated chunk by chunk to bound memory
+    path = Path(path)
+    parquet = path.suffix == ".parquet"
+    if parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    writer = None
+    first = True
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        for df in generate(n, years, nan_rate, seed + start, start):
+            if parquet:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                df.to_csv(path, mode="w" if first else "a", header=first, index=False)
+            first = False
+    if writer is not None:
+        writer.close()
+    return path
+
+
+def write_store(data_dir: Path, rows: int, years=(BASE_YEAR,), nan_rate: float = 0.0, seed: int = 0) -> list:
+    # one partition per year, laid out the way pipeline.discover_partitions reads them
+    written = []
+    for year, df in zip(years, generate(rows, years, nan_rate, seed)):
+        out = partition_path(data_dir, year, f"{DATASET_BASE}{year}")
+        out.parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(out, index=False)
+        written.append(out)
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write a synthetic Cleaned Data.csv-shaped file.")
+    parser.add_argument("out", type=Path, help=".csv or .parquet, or a directory with --store")
+    parser.add_argument("--store", action="store_true", help="write a year-partitioned store into `out`")
+    parser.add_argument("--rows", type=int, default=1137, help="towns per year")
+    parser.add_argument("--years", type=int, nargs="+", default=[BASE_YEAR])
+    parser.add_argument("--nan-rate", type=float, default=0.0, help="share of missing existence flags")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.store:
+        write_store(args.out, args.rows, args.years, args.nan_rate, args.seed)
+    else:
+        write(args.out, args.rows, args.years, args.nan_rate, args.seed)
+    print(f"wrote {args.rows * len(args.years):,} rows to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# Split raw trade CSVs into the partitioned store the dashboard reads
+# (DATA_DIR/year=<year>/dataset=<dataset URI>/data.csv), one partition per
+# value of the `dataset` column.
+#
+#   python partition_data.py "Cleaned Data.csv"
+#   python partition_data.py extract-2024.csv --data-dir /srv/trade-data
+import argparse
+import sys
+from pathlib import Path
+
+from pipeline import DATA_DIR, write_partitions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Split trade CSVs into year/dataset partitions.")
+    parser.add_argument("csv", type=Path, nargs="+")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    args = parser.parse_args(argv)
+
+    for csv_path in args.csv:
+        for out in write_partitions(csv_path, args.data_dir):
+            print(f"{csv_path} -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,827 @@
+# Data side of dashboard.py: loading, cleaning and the aggregations behind the
+# visuals. Nothing here imports streamlit, so bench.py can run it headlessly.
+import hashlib
+import importlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import CancelledError, Future
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+# Copy-on-Write: selections and slices share memory with their source until
+# one of them is written to (always on from pandas 3, opt-in on pandas 2.x)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# === PATH TO CSV =============================================================
+CSV_PATH = Path(__file__).parent / "Cleaned Data.csv"
+
+# Columnar snapshots of the cleaned CSV live here (one per CSV version).
+# Bump SNAPSHOT_VERSION whenever the cleaning in parse_csv changes.
+CACHE_DIR = Path(__file__).parent / ".cache"
+SNAPSHOT_VERSION = 3
+
+# Partitioned store: DATA_DIR/year=<year>/dataset=<quoted dataset URI>/data.csv.
+# Without one, CSV_PATH is the only partition (the 2023 trade dataset).
+DATA_DIR = Path(os.environ.get("DASHBOARD_DATA_DIR", Path(__file__).parent / "data"))
+DEFAULT_DATASET = "http://linked.aub.edu.lb/CODEC/Lebanon/Dataset/Trade-Lebanon-2023"
+
+logger = logging.getLogger("dashboard.pipeline")
+
+# === COLUMN SETS =============================================================
+COMMERCIAL_SIZE_COLS = [
+    "Total number of commercial institutions by size - number of small institutions",
+    "Total number of commercial institutions by size - number of medium-sized institutions",
+    "Total number of commercial institutions by size - number of large-sized institutions",
+]
+OTHER_COLS = [
+    "Total number of service institutions",
+    "Total number of non banking financial institutions",
+]
+EXISTENCE_COLS = [
+    "Existence of commercial and service activities by type - self employment",
+    "Existence of commercial and service activities by type - public sector",
+    "Existence of commercial and service activities by type - banking institutions",
+    "Existence of commercial and service activities by type - service institutions",
+    "Existence of commercial and service activities by type - commerce",
+]
+EXISTENCE_LABELS = {
+    EXISTENCE_COLS[0]: "Self-employment",
+    EXISTENCE_COLS[1]: "Public sector",
+    EXISTENCE_COLS[2]: "Banking",
+    EXISTENCE_COLS[3]: "Service institutions",
+    EXISTENCE_COLS[4]: "Commerce",
+}
+
+# legend mapping for Visual 1
+SIZE_MAP = {
+    COMMERCIAL_SIZE_COLS[0]: "Commercial — Small",
+    COMMERCIAL_SIZE_COLS[1]: "Commercial — Medium",
+    COMMERCIAL_SIZE_COLS[2]: "Commercial — Large",
+}
+OTHER_MAP = {
+    "Total number of service institutions": "Service institutions",
+    "Total number of non banking financial institutions": "Non-banking financial institutions",
+}
+
+# Only these columns are parsed by parse_csv; the long provenance strings are
+# skipped and fetched separately (read_columns) when the drill-down asks.
+KEY_COLS = ["Town", "refArea"]
+LOAD_COLS = KEY_COLS + COMMERCIAL_SIZE_COLS + OTHER_COLS + EXISTENCE_COLS
+PROVENANCE_COLS = ["Observation URI", "publisher", "dataset", "references"]
+STRING_DTYPES = {c: str for c in KEY_COLS + PROVENANCE_COLS}
+
+# === LOAD & PREP =============================================================
+@lru_cache(maxsize=4096)
+def clean_area(x: str) -> str:
+    s = str(x)
+    if "/" in s:
+        s = s.rsplit("/", 1)[-1]
+    s = s.replace("-", " ").replace("_", " ").strip().title()
+    if "Governorate" not in s and "District" not in s:
+        s = f"{s} Governorate"
+    return s
+
+
+def normalize_areas(ref_area: pd.Series) -> pd.Series:
+    # clean each distinct refArea once and broadcast the result back through
+    # the factorized codes, so the cost follows the number of areas, not rows
+    codes, uniques = pd.factorize(ref_area, use_na_sentinel=False)
+    labels = [clean_area(u) for u in uniques]
+    # several URIs can clean to the same label; sort=True keeps categories
+    # in the same (alphabetical) order and dtype astype("category") would give
+    label_codes, categories = pd.factorize(pd.Index(labels), sort=True)
+    return pd.Series(
+        pd.Categorical.from_codes(label_codes[codes], categories=categories),
+        index=ref_area.index,
+        name="Governorate",
+    )
+
+
+def read_columns(csv_path, columns: list) -> pd.DataFrame:
+    wanted = set(columns)
+    df = pd.read_csv(
+        csv_path,
+        encoding="utf-8-sig",
+        usecols=lambda c: c.strip() in wanted,
+        dtype=STRING_DTYPES,
+    )
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+
+def parse_csv(csv_path) -> pd.DataFrame:
+    df = read_columns(csv_path, LOAD_COLS)
+
+    # ~25 distinct areas over all rows: categoricals store each label once
+    df["Governorate"] = normalize_areas(df["refArea"])
+    df["refArea"] = df["refArea"].astype("category")
+
+    # counts go into the narrowest unsigned int that holds them (uint16 today)
+    for col in COMMERCIAL_SIZE_COLS + OTHER_COLS:
+        df[col] = pd.to_numeric(
+            pd.to_numeric(df[col], errors="coerce").fillna(0), downcast="unsigned"
+        )
+
+    # Keeping NaN as NaN (<NA> in a nullable Int8) to reflect “no data”
+    for col in EXISTENCE_COLS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int8")
+
+    return df
+
+
+def file_stamp(path) -> tuple:
+    # cheap identity of the file on disk: changes whenever it is rewritten
+    stat = Path(path).stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+@lru_cache(maxsize=256)
+def content_hash(path: Path, size: int, mtime_ns: int) -> str:
+    # size/mtime are only the memo key: a file is hashed once per version.
+    # Only the first `size` bytes count, so a concurrent append can't leak in.
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        left = size
+        while left > 0:
+            chunk = f.read(min(1 << 20, left))
+            if not chunk:
+                break
+            digest.update(chunk)
+            left -= len(chunk)
+    return digest.hexdigest()[:16]
+
+
+def snapshot_path(csv_path, cache_dir: Path = CACHE_DIR, kind: str = "frame") -> Path:
+    # key = size + mtime + content hash, so a touched-but-identical file
+    # gets a new name and a rewritten file with a restored mtime still misses
+    csv_path = Path(csv_path)
+    size, mtime_ns = file_stamp(csv_path)
+    key = f"v{SNAPSHOT_VERSION}-{size}-{mtime_ns}-{content_hash(csv_path, size, mtime_ns)}"
+    # partitions all hold a data.csv: the source directory keeps names apart
+    where = hashlib.sha256(str(csv_path.resolve().parent).encode()).hexdigest()[:8]
+    return Path(cache_dir) / f"{csv_path.stem}-{where}.{key}.{kind}.parquet"
+
+
+def write_snapshot(df: pd.DataFrame, path: Path) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)  # atomic, so replicas never read a half-written file
+    except (ImportError, OSError):
+        # no parquet engine or read-only disk: just keep serving from the CSV
+        return
+    # drop snapshots of the same kind built from older versions of the CSV
+    stem, _, kind, _ = path.name.rsplit(".", 3)
+    for old in path.parent.glob(f"{stem}.v*.{kind}.parquet"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def cached_table(csv_path, kind: str, build, cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    # `build()` for this version of the CSV, through a Parquet snapshot
+    snapshot = snapshot_path(csv_path, cache_dir, kind)
+    if snapshot.exists():
+        try:
+            return pd.read_parquet(snapshot)
+        except Exception:
+            pass  # unreadable snapshot: rebuild it below
+
+    df = build()
+    write_snapshot(df, snapshot)
+    return df
+
+
+def load_frame(csv_path, cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    # the cleaned frame, from the Parquet snapshot when one matches the CSV
+    return cached_table(csv_path, "frame", lambda: parse_csv(csv_path), cache_dir)
+
+
+def load_partition_gov_agg(csv_path, cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    # per-partition aggregates are stored next to the frame snapshot, so
+    # comparing years later never has to go back to the town-level rows
+    return cached_table(
+        csv_path, "gov", lambda: aggregate_governorates(load_frame(csv_path, cache_dir)), cache_dir
+    )
+
+
+def load_partition_existence(csv_path, cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    return cached_table(
+        csv_path, "exist", lambda: existence_counts(load_frame(csv_path, cache_dir)), cache_dir
+    )
+
+
+# === SIDEBAR IMAGE ===========================================================
+def webp_thumbnail(src: Path, width: int, stamp: tuple, cache_dir: Path = CACHE_DIR) -> str:
+    # path of a `width`-wide WebP copy of the image at version `stamp`, or of
+    # the original when it can't be written (no WebP encoder in this Pillow
+    # build, which raises KeyError, or a read-only disk)
+    from PIL import Image
+
+    src = Path(src)
+    out = Path(cache_dir) / f"{src.stem}.{width}w.{stamp[1]}.webp"
+    if out.exists():
+        return str(out)
+    tmp = out.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(src) as im:
+            im.thumbnail((width, width * 4), Image.LANCZOS)
+            im.save(tmp, "WEBP", quality=80, method=6)
+        os.replace(tmp, out)
+    except (OSError, KeyError, ValueError):
+        tmp.unlink(missing_ok=True)
+        return str(src)
+    for old in out.parent.glob(f"{src.stem}.*.webp"):
+        if old != out:
+            old.unlink(missing_ok=True)
+    return str(out)
+
+
+# === SINGLE FLIGHT ===========================================================
+class SingleFlight:
+    # at most one build per key at a time: callers arriving while it runs wait
+    # for that build and get its result, or its exception. Nothing is kept
+    # afterwards, so the next caller after a failure tries again.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, build):
+        while True:
+            with self._lock:
+                future = self._flights.get(key)
+                leader = future is None
+                if leader:
+                    future = self._flights[key] = Future()
+            if leader:
+                break
+            try:
+                return future.result()
+            except CancelledError:
+                if not future.cancelled():
+                    raise  # raised by the build itself
+                # the leader was stopped: start over, maybe as the leader
+
+        try:
+            result = build()
+        except BaseException as exc:
+            self._land(key)
+            if isinstance(exc, Exception):
+                future.set_exception(exc)
+            else:
+                # the leader's own run was stopped or restarted (streamlit's
+                # StopException / RerunException, KeyboardInterrupt): that is
+                # no outcome of the build, so waiters build for themselves
+                future.cancel()
+            raise
+        self._land(key)
+        future.set_result(result)
+        return result
+
+    def _land(self, key) -> None:
+        # before waking the waiters, so a retry starts a new flight
+        with self._lock:
+            del self._flights[key]
+
+
+# === INCREMENTAL RELOAD ======================================================
+# The data team appends towns to the CSV. Per file we remember how many bytes
+# were parsed; when the file has only grown since, just the new lines are
+# parsed and folded into the frame and the per-partition aggregates (which are
+# all sums). Any other change (rewrite, truncation, new header) is a full load.
+TAIL_BYTES = 4096  # bytes before the parsed offset that must still match
+
+
+class LoadedFile(NamedTuple):
+    stamp: tuple  # file_stamp the tables below are current for
+    offset: int  # bytes parsed so far, None when appends can't be trusted
+    head: bytes  # header line
+    tail: bytes  # last TAIL_BYTES parsed bytes
+    frame: pd.DataFrame
+    gov_agg: pd.DataFrame
+    exist: pd.DataFrame
+
+
+_loaded = {}
+_loading = SingleFlight()  # one parse per file version, however many sessions ask
+
+
+def _read_marks(csv_path, offset: int) -> tuple:
+    with open(csv_path, "rb") as f:
+        head = f.readline()
+        f.seek(max(offset - TAIL_BYTES, 0))
+        tail = f.read(min(offset, TAIL_BYTES))
+    return head, tail
+
+
+def _full_load(csv_path: Path, stamp: tuple, cache_dir: Path) -> LoadedFile:
+    frame = load_frame(csv_path, cache_dir)
+    gov_agg = load_partition_gov_agg(csv_path, cache_dir)
+    exist = load_partition_existence(csv_path, cache_dir)
+    head, tail = _read_marks(csv_path, stamp[0])
+    # only resume from a complete last line of the file that was actually loaded
+    ok = tail.endswith(b"\n") and file_stamp(csv_path) == stamp
+    return LoadedFile(stamp, stamp[0] if ok else None, head, tail, frame, gov_agg, exist)
+
+
+def _append(state: LoadedFile, csv_path: Path, stamp: tuple):
+    # state advanced over the lines appended since it was loaded, or None
+    # when the file changed in some other way
+    if state.offset is None or stamp[0] < state.offset:
+        return None
+    head, tail = _read_marks(csv_path, state.offset)
+    if head != state.head or tail != state.tail:
+        return None
+    with open(csv_path, "rb") as f:
+        f.seek(state.offset)
+        new = f.read(stamp[0] - state.offset)
+    end = new.rfind(b"\n") + 1  # a half-written last line waits for the next change
+    if not end:
+        return state._replace(stamp=stamp)
+    try:
+        delta = parse_csv(io.BytesIO(head + new[:end]))
+    except (ValueError, pd.errors.ParserError):
+        return None
+    offset = state.offset + end
+    tail = (state.tail + new[:end])[-TAIL_BYTES:]
+    if delta.empty:
+        return state._replace(stamp=stamp, offset=offset, tail=tail)
+    return LoadedFile(
+        stamp, offset, head, tail,
+        combine_frames([state.frame, delta]),
+        combine_gov_aggs([state.gov_agg, aggregate_governorates(delta)]),
+        combine_existence_counts([state.exist, existence_counts(delta)]),
+    )
+
+
+def load_incremental(csv_path, cache_dir: Path = CACHE_DIR) -> LoadedFile:
+    # frame + aggregates for the file as it is now, parsing only what was appended
+    csv_path = Path(csv_path)
+    key = csv_path.resolve()
+    stamp = file_stamp(csv_path)
+    state = _loaded.get(key)
+    if state is not None and state.stamp == stamp:
+        return state
+    return _loading.do((key, stamp), lambda: _refresh(csv_path, key, stamp, cache_dir))
+
+
+def _refresh(csv_path: Path, key: Path, stamp: tuple, cache_dir: Path) -> LoadedFile:
+    state = _loaded.get(key)
+    if state is not None and state.stamp == stamp:
+        return state  # loaded by a flight that ended just before this one
+    updated = _append(state, csv_path, stamp) if state is not None else None
+    if updated is None:
+        updated = _full_load(csv_path, stamp, cache_dir)
+    elif (updated.offset == stamp[0] and updated.frame is not state.frame
+          and file_stamp(csv_path) == stamp):
+        # keep the snapshots current for other processes and restarts
+        for kind, table in (("frame", updated.frame), ("gov", updated.gov_agg), ("exist", updated.exist)):
+            write_snapshot(table, snapshot_path(csv_path, cache_dir, kind))
+    _loaded[key] = updated
+    return updated
+
+
+def forget_loaded(csv_path=None) -> None:
+    # drop what load_incremental keeps of `csv_path` (of every file when
+    # None), so the next load starts over from the snapshot or the CSV
+    if csv_path is None:
+        _loaded.clear()
+    else:
+        _loaded.pop(Path(csv_path).resolve(), None)
+
+
+# === READ-ONLY SHARED FRAMES =================================================
+# The loaded frame is handed to every session and rerun as-is, without a copy.
+# freeze() makes its buffers read-only and its column set fixed, so an
+# in-place write raises right away instead of leaking into other sessions.
+# pandas has no public API for this: it goes through the block manager, and a
+# pandas version without those internals just leaves the values writable
+# (tests/test_frozen.py notices).
+READ_ONLY = "assignment destination is read-only"  # numpy's message for a locked buffer
+
+
+class FrozenFrame(pd.DataFrame):
+    # what freeze() turns a frame into: adding, replacing, dropping or
+    # renaming columns raises like a write to a locked buffer does. Anything
+    # derived from it (slices, groupbys, copies) is an ordinary DataFrame.
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _read_only(self, *args, **kwargs):
+        raise ValueError(READ_ONLY)
+
+    __setitem__ = __delitem__ = insert = pop = update = _read_only
+
+    def __setattr__(self, name, value):
+        if name in ("columns", "index"):
+            self._read_only()
+        super().__setattr__(name, value)
+
+
+def _not_inplace(method):
+    def call(self, *args, inplace=False, **kwargs):
+        if inplace:
+            self._read_only()
+        return method(self, *args, **kwargs)
+    return call
+
+
+for _name in ("bfill", "clip", "drop", "drop_duplicates", "dropna", "eval", "ffill", "fillna",
+              "interpolate", "mask", "query", "rename", "rename_axis", "replace", "reset_index",
+              "set_index", "sort_index", "sort_values", "where"):
+    setattr(FrozenFrame, _name, _not_inplace(getattr(pd.DataFrame, _name)))
+
+
+def freeze(df: pd.DataFrame) -> FrozenFrame:
+    # Arrow-backed strings (pandas 3's default for Town) have no buffer that
+    # could be locked: those columns are kept as numpy object arrays instead
+    for col in df.columns[[isinstance(t, pd.StringDtype) for t in df.dtypes]]:
+        df[col] = df[col].astype(object)
+    # in place rather than a wrapper: a second frame over the same blocks
+    # would make copy-on-write copy them on a write instead of raising
+    df.__class__ = FrozenFrame
+    try:
+        df._consolidate_inplace()  # so later reads never regroup the blocks
+        blocks = df._mgr.blocks
+    except AttributeError:
+        return df
+    for block in blocks:
+        values = getattr(block, "values", None)
+        # numpy blocks, or the numpy parts of categorical / nullable int columns
+        arrays = [values] if isinstance(values, np.ndarray) else [
+            getattr(values, name, None) for name in ("_ndarray", "_codes", "_data", "_mask")
+        ]
+        for arr in arrays:
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+    return df
+
+
+# === PARTITIONS ==============================================================
+class Partition(NamedTuple):
+    year: int
+    dataset: str  # dataset URI, as in the `dataset` column
+    path: Path
+
+    @property
+    def label(self) -> str:
+        return f"{self.year} · {self.dataset.rstrip('/').rsplit('/', 1)[-1]}"
+
+
+def dataset_year(dataset: str) -> int:
+    # trade dataset URIs end in their year (".../Trade-Lebanon-2023")
+    match = re.search(r"(\d{4})\D*$", dataset)
+    return int(match.group(1)) if match else 0
+
+
+def partition_path(data_dir: Path, year: int, dataset: str) -> Path:
+    return Path(data_dir) / f"year={year}" / f"dataset={quote(dataset, safe='')}" / "data.csv"
+
+
+def discover_partitions(data_dir: Path = DATA_DIR, fallback: Path = CSV_PATH) -> list:
+    parts = []
+    for path in Path(data_dir).glob("year=*/dataset=*/data.csv"):
+        try:
+            year = int(path.parent.parent.name.split("=", 1)[1])
+        except ValueError:
+            # a stray directory (say year=tmp) must not take the store down
+            logger.warning("skipping %s: not a year=<year> partition", path)
+            continue
+        dataset = unquote(path.parent.name.split("=", 1)[1])
+        parts.append(Partition(year, dataset, path))
+    if not parts and Path(fallback).exists():
+        parts.append(Partition(dataset_year(DEFAULT_DATASET), DEFAULT_DATASET, Path(fallback)))
+    return sorted(parts)
+
+
+def write_partitions(csv_path, data_dir: Path = DATA_DIR) -> list:
+    # split a raw CSV into one partition per value of its `dataset` column
+    raw = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=str)
+    raw.columns = [c.strip() for c in raw.columns]
+    written = []
+    for dataset, part in raw.groupby("dataset", sort=True):
+        out = partition_path(data_dir, dataset_year(dataset), dataset)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        part.to_csv(out, index=False)
+        written.append(out)
+    return written
+
+
+def combine_frames(frames: list) -> pd.DataFrame:
+    # categories differ between partitions, so rebuild them after the concat
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    for col in ("Governorate", "refArea"):
+        df[col] = df[col].astype(str).astype("category")
+    return df
+
+
+def combine_gov_aggs(aggs: list) -> pd.DataFrame:
+    # every column of aggregate_governorates is a sum, so partitions just add up
+    if len(aggs) == 1:
+        return aggs[0]
+    agg = pd.concat(aggs, ignore_index=True)
+    agg["Governorate"] = agg["Governorate"].astype(str)
+    agg = agg.groupby("Governorate", as_index=False).sum()
+    return agg.sort_values("All total", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def combine_existence_counts(counts: list) -> pd.DataFrame:
+    if len(counts) == 1:
+        return counts[0]
+    df = pd.concat(counts, ignore_index=True)
+    df["Governorate"] = df["Governorate"].astype(str)
+    df = df.groupby(["Governorate", "ActivityRaw"], as_index=False)[["NumTowns", "Denom"]].sum()
+    df["Activity"] = df["ActivityRaw"].map(EXISTENCE_LABELS)
+    df["Value"] = df["NumTowns"]
+    return df
+
+
+def merge_town_indexes(indexes: list) -> dict:
+    if len(indexes) == 1:
+        return indexes[0]
+    merged = {}
+    for index in indexes:
+        for key, towns in index.items():
+            merged.setdefault(key, set()).update(towns)
+    return {key: tuple(sorted(towns)) for key, towns in merged.items()}
+
+
+# === AGGREGATES ==============================================================
+def aggregate_governorates(df: pd.DataFrame) -> pd.DataFrame:
+    # one row per governorate: institution sums, totals and number of towns,
+    # largest first, so the sidebar filters only ever slice this small table
+    agg = df.groupby("Governorate", as_index=False, observed=True)[COMMERCIAL_SIZE_COLS + OTHER_COLS].sum()
+    agg["Commercial (total)"] = agg[COMMERCIAL_SIZE_COLS].sum(axis=1)
+    agg["All total"] = (
+        agg["Commercial (total)"]
+        + agg["Total number of service institutions"]
+        + agg["Total number of non banking financial institutions"]
+    )
+    agg["Towns"] = df.groupby("Governorate", observed=True).size().to_numpy()
+    return agg.sort_values("All total", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def build_town_index(df: pd.DataFrame) -> dict:
+    # (Governorate, Activity label) -> sorted, de-duplicated towns where the
+    # activity exists, so the drill-down is a dictionary lookup
+    index = {}
+    for col, label in EXISTENCE_LABELS.items():
+        present = df.loc[df[col].eq(1).fillna(False), ["Governorate", "Town"]].dropna()
+        for gov, towns in present.groupby("Governorate", observed=True)["Town"]:
+            index[(gov, label)] = tuple(sorted(towns.unique()))
+    return index
+
+
+def filter_agg(gov_agg: pd.DataFrame, sel_govs, top_n_gov: int) -> pd.DataFrame:
+    # gov_agg is already summed and sorted by "All total": filtering is a slice
+    return gov_agg[gov_agg["Governorate"].isin(sel_govs)].head(top_n_gov)
+
+
+def filter_towns(df: pd.DataFrame, govs) -> pd.DataFrame:
+    return df[df["Governorate"].isin(govs)]
+
+
+def filter_existence(exist_counts: pd.DataFrame, govs) -> pd.DataFrame:
+    # existence counts are per governorate, so the counts over the towns of
+    # `govs` are rows of the all-towns table: a slice of ~125 rows instead of
+    # a copy of the matching town rows on every rerun
+    return exist_counts[exist_counts["Governorate"].isin(govs)]
+
+
+def filter_view(gov_agg: pd.DataFrame, exist_counts: pd.DataFrame, sel_govs, top_n_gov: int) -> tuple:
+    # what a filter change recomputes: (agg, top governorates, existence
+    # counts) of the top N selected governorates, all slices of tables that
+    # were aggregated at load time
+    agg = filter_agg(gov_agg, sel_govs, top_n_gov)
+    top_govs = tuple(agg["Governorate"].tolist())
+    return agg, top_govs, filter_existence(exist_counts, top_govs)
+
+
+def v1_long(agg: pd.DataFrame, show_pct_comm: bool, split_commercial: bool) -> tuple:
+    # Visual 1 in long form: (long_v1, series_order, y_title)
+    if split_commercial:
+        cols_to_use = COMMERCIAL_SIZE_COLS + OTHER_COLS
+        long_v1 = agg.melt(id_vars="Governorate", value_vars=cols_to_use, var_name="Raw", value_name="Value")
+        long_v1["Series"] = long_v1["Raw"].map({**SIZE_MAP, **OTHER_MAP})
+        series_order = ["Commercial — Small", "Commercial — Medium", "Commercial — Large",
+                        "Service institutions", "Non-banking financial institutions"]
+    else:
+        tmp = agg[["Governorate", "Commercial (total)"] + OTHER_COLS].rename(
+            columns={"Commercial (total)": "Commercial"}
+        )
+        long_v1 = tmp.melt(id_vars="Governorate", value_vars=["Commercial"] + OTHER_COLS,
+                           var_name="Series", value_name="Value")
+        long_v1["Series"] = long_v1["Series"].replace({
+            "Commercial": "Commercial (total)",
+            "Total number of service institutions": "Service institutions",
+            "Total number of non banking financial institutions": "Non-banking financial institutions",
+        })
+        series_order = ["Commercial (total)", "Service institutions", "Non-banking financial institutions"]
+
+    if show_pct_comm:
+        long_v1["RowSum"] = long_v1.groupby("Governorate", observed=True)["Value"].transform(lambda s: max(s.sum(), 1))
+        long_v1["Value"] = (long_v1["Value"] / long_v1["RowSum"]) * 100
+        y_title = "Percent of institutions (%)"
+    else:
+        y_title = "Number of institutions"
+
+    return long_v1, series_order, y_title
+
+
+def existence_counts(dff: pd.DataFrame) -> pd.DataFrame:
+    # Visual 3 counts per (Governorate, activity) over the given towns
+    flags = dff[EXISTENCE_COLS]
+
+    # One wide groupby gives both counts for all activities at once:
+    # NumTowns = towns with activity present (== 1),
+    # Denom = towns that actually have data for that activity (non-null)
+    wide = pd.concat(
+        [flags.eq(1).fillna(False), flags.notna()],
+        axis=1,
+        keys=["NumTowns", "Denom"],
+    ).groupby(dff["Governorate"], observed=True).sum()
+
+    # Reshape only the governorate x activity result cells to long form
+    exist_counts = (
+        wide.stack(level=1, future_stack=True)
+        .rename_axis(["Governorate", "ActivityRaw"])
+        .reset_index()
+        .sort_values(["Governorate", "ActivityRaw"], ignore_index=True)
+    )
+
+    # Map clean labels
+    exist_counts["Activity"] = exist_counts["ActivityRaw"].map(EXISTENCE_LABELS)
+    exist_counts["Value"] = exist_counts["NumTowns"]
+    return exist_counts
+
+
+# === YEAR OVER YEAR ==========================================================
+# Deltas are joins of two small aggregate tables (one row per governorate,
+# or per governorate x activity), never a re-scan of the town-level rows.
+def _numeric(df: pd.DataFrame, keys: list, cols: list) -> pd.DataFrame:
+    # int64 so that "after - before" can go negative (the counts are unsigned)
+    df = df.assign(Governorate=df["Governorate"].astype(str))
+    return df.set_index(keys)[cols].astype("int64")
+
+
+def gov_agg_delta(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    # same columns as aggregate_governorates, holding after - before, ordered
+    # by the later year's "All total" so filter_agg's top N still applies
+    cols = [c for c in after.columns if c != "Governorate"]
+    b = _numeric(before, ["Governorate"], cols)
+    a = _numeric(after, ["Governorate"], cols)
+    delta = a.sub(b, fill_value=0).astype("int64")
+    rank = a["All total"].reindex(delta.index, fill_value=0)
+    order = rank.sort_values(ascending=False, kind="stable").index
+    return delta.loc[order].reset_index()
+
+
+def existence_delta(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    # existence_counts layout, NumTowns / Denom / Value holding after - before
+    keys, cols = ["Governorate", "ActivityRaw"], ["NumTowns", "Denom"]
+    delta = _numeric(after, keys, cols).sub(_numeric(before, keys, cols), fill_value=0)
+    delta = delta.astype("int64").reset_index().sort_values(keys, ignore_index=True)
+    delta["Activity"] = delta["ActivityRaw"].map(EXISTENCE_LABELS)
+    delta["Value"] = delta["NumTowns"]
+    return delta
+
+
+# === QUERY BACKENDS ==========================================================
+# Every engine behind DASHBOARD_BACKEND answers the dashboard through the same
+# query source, opened on a set of partition files:
+#   gov_agg()                -> the aggregate_governorates table
+#   existence_counts(govs)   -> the existence_counts table, over the towns of
+#                               `govs` (all governorates when None)
+#   towns(gov, label)        -> the build_town_index entry for (gov, label)
+#   sources(gov, label)      -> Town + provenance columns of those towns' rows
+#   town_lookup()            -> a dict-like (gov, label) -> towns
+# with the same columns and row order as the pandas functions above.
+QUERY_BACKENDS = {
+    "pandas": "pipeline.PandasSource",
+    "duckdb": "duckdb_backend.DuckDBSource",
+    "polars": "polars_backend.PolarsSource",
+}
+
+
+class TownLookup:
+    # stands in for build_town_index's dict: towns are queried per lookup,
+    # across the sources of all selected partitions
+    def __init__(self, *sources):
+        self.sources = sources
+
+    def get(self, key: tuple, default=()) -> tuple:
+        if len(self.sources) == 1:
+            return self.sources[0].towns(*key) or default
+        towns = set()
+        for source in self.sources:
+            towns.update(source.towns(*key))
+        return tuple(sorted(towns)) or default
+
+    def count(self, key: tuple) -> int:
+        # towns counted once per source they are in: what the summed
+        # per-partition counts hold (town-years, over several years)
+        return sum(len(source.towns(*key)) for source in self.sources)
+
+
+class PandasSource:
+    # the default: the towns loaded into one read-only pandas frame per file
+    # (load_incremental), aggregated and indexed once. `shared` is a
+    # shared_cache.SharedCache the loaded tables go through, so replicas
+    # don't each parse the same file; `cache_dir` holds the snapshots.
+    def __init__(self, paths, shared=None, cache_dir: Path = CACHE_DIR):
+        self.paths = tuple(Path(p) for p in paths)
+        self.shared = shared
+        self.cache_dir = Path(cache_dir)
+        self.frames = [freeze(self._table(p, "frame")) for p in self.paths]
+        self._gov_agg = combine_gov_aggs([self._table(p, "gov") for p in self.paths])
+        self._exist = combine_existence_counts([self._table(p, "exist") for p in self.paths])
+        self._index = merge_town_indexes([build_town_index(df) for df in self.frames])
+
+    def _table(self, path: Path, kind: str) -> pd.DataFrame:
+        def build():
+            state = load_incremental(path, self.cache_dir)
+            return {"frame": state.frame, "gov": state.gov_agg, "exist": state.exist}[kind]
+
+        if self.shared is None:
+            return build()
+        return self.shared.get_or_build("frame", (kind, str(path), file_stamp(path)), build)
+
+    def gov_agg(self) -> pd.DataFrame:
+        return self._gov_agg
+
+    def existence_counts(self, govs=None) -> pd.DataFrame:
+        return self._exist if govs is None else filter_existence(self._exist, govs)
+
+    def towns(self, gov: str, label: str) -> tuple:
+        return self._index.get((gov, label), ())
+
+    def sources(self, gov: str, label: str) -> pd.DataFrame:
+        # provenance is not part of the loaded frames: read on request and
+        # matched to the rows by index, within each file
+        col = {lab: c for c, lab in EXISTENCE_LABELS.items()}[label]
+        found = []
+        for path, df in zip(self.paths, self.frames):
+            rows = df[(df["Governorate"] == gov) & (df[col] == 1)]
+            prov = read_columns(path, PROVENANCE_COLS).loc[rows.index, PROVENANCE_COLS]
+            prov.insert(0, "Town", rows["Town"])
+            found.append(prov)
+        return pd.concat(found, ignore_index=True).sort_values("Town", kind="stable", ignore_index=True)
+
+    def town_lookup(self) -> TownLookup:
+        return TownLookup(self)
+
+
+def open_source(backend: str, paths, **options):
+    # backends are optional dependencies: imported only when asked for
+    module, _, name = QUERY_BACKENDS[backend].rpartition(".")
+    return getattr(importlib.import_module(module), name)(paths, **options)
+
+
+SOURCE_VERSIONS = 2  # per file: the version being served and the one before
+_sources = {}  # (backend, file) -> {stamp: source}, oldest version first
+_opening = SingleFlight()
+
+
+def query_source(backend: str, path, stamp: tuple, **options):
+    # the source over one partition file at version `stamp`. Sessions still
+    # on the previous version while the watcher warms the next one keep
+    # their source; older ones close (connection, tables, memory) as soon as
+    # the runs still using them let go. A file is only ever opened as it is
+    # on disk and filed under that stamp, so a stamp that is gone gets the
+    # current source rather than new data under the old stamp. `options`
+    # go to the backend when the source is opened.
+    key = (backend, Path(path).resolve())
+    source = _sources.get(key, {}).get(stamp)
+    if source is not None:
+        return source
+    current = file_stamp(path)
+    return _opening.do((key, current), lambda: _open(key, path, current, options))
+
+
+def _open(key: tuple, path, stamp: tuple, options: dict):
+    source = _sources.get(key, {}).get(stamp)
+    if source is not None:
+        return source  # opened by a flight that ended just before this one
+    source = open_source(key[0], [path], **options)
+    # a new dict rather than an update, so lookups never see one mid-change
+    versions = [*_sources.get(key, {}).items(), (stamp, source)]
+    _sources[key] = dict(versions[-SOURCE_VERSIONS:])
+    return source
+
+
+def drop_source(backend: str, path) -> None:
+    # for a file that is gone: nothing will replace its sources
+    _sources.pop((backend, Path(path).resolve()), None)
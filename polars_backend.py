@@ -0,0 +1,143 @@
+# Optional Polars execution of the dashboard's aggregations
+# (DASHBOARD_BACKEND=polars). Each query is one lazy plan over the cleaned
+# towns (filter -> group by -> reshape), which Polars optimizes as a whole and
+# runs on all cores. Results have the same columns and row order as their
+# pandas counterparts in pipeline.py (see QUERY BACKENDS there).
+import pandas as pd
+import polars as pl  # optional dependency: pip install polars
+
+from pipeline import (
+    COMMERCIAL_SIZE_COLS,
+    EXISTENCE_COLS,
+    EXISTENCE_LABELS,
+    LOAD_COLS,
+    OTHER_COLS,
+    PROVENANCE_COLS,
+    TownLookup,
+    clean_area,
+)
+
+COUNT_COLS = COMMERCIAL_SIZE_COLS + OTHER_COLS
+GOV_AGG_COLS = ["Governorate"] + COUNT_COLS + ["Commercial (total)", "All total", "Towns"]
+
+
+def _scan(path) -> pl.LazyFrame:
+    path = str(path)
+    if path.endswith(".parquet"):
+        lf = pl.scan_parquet(path)
+    else:
+        lf = pl.scan_csv(path, infer_schema=False)  # every column as text, like dtype=str
+    # stray spaces (and a BOM) around header names, as read_columns strips them
+    names = lf.collect_schema().names()
+    return lf.rename({c: c.lstrip("\ufeff").strip() for c in names})
+
+
+def _ref_area() -> pl.Expr:
+    return pl.col("refArea").cast(pl.String).fill_null("nan")
+
+
+def _number(col: str) -> pl.Expr:
+    # pd.to_numeric(errors="coerce"): anything unparsable becomes null
+    return pl.col(col).cast(pl.String).str.strip_chars().cast(pl.Float64, strict=False)
+
+
+class PolarsSource:
+    # the cleaned towns of the given files as a lazy Polars plan that every
+    # query extends. Parquet is columnar already and is scanned per query; a
+    # CSV would be re-parsed every time, so its load columns (not the long
+    # provenance strings) are collected once into Arrow memory.
+    def __init__(self, paths):
+        self.paths = tuple(paths)
+        names = self._raw().collect_schema().names()
+        missing = [c for c in LOAD_COLS if c not in names]
+        if missing:
+            raise KeyError(f"missing columns: {missing}")
+        self.provenance = [c for c in PROVENANCE_COLS if c in names]
+
+        # ~25 distinct areas, cleaned in Python; a missing area cleans the way
+        # pandas' NaN does ("nan" -> "Nan Governorate")
+        areas = self._raw().select(_ref_area().unique()).collect()["refArea"].to_list()
+        self._labels = {a: clean_area(a) for a in areas}
+
+        towns = self._raw().select(
+            self._governorate(),
+            pl.col("Town").cast(pl.String),
+            *[_number(c).fill_null(0).alias(c) for c in COUNT_COLS],
+            *[_number(c).alias(c) for c in EXISTENCE_COLS],
+        )
+        if not all(str(p).endswith(".parquet") for p in self.paths):
+            towns = towns.collect().lazy()
+        self._towns = towns
+
+    def _raw(self) -> pl.LazyFrame:
+        return pl.concat([_scan(p) for p in self.paths], how="diagonal_relaxed")
+
+    def _governorate(self) -> pl.Expr:
+        # areas that appeared after the source was opened have no label (null)
+        return _ref_area().replace_strict(self._labels, default=None, return_dtype=pl.String).alias("Governorate")
+
+    def _lazy(self, govs=None) -> pl.LazyFrame:
+        lf = self._towns
+        if govs is not None:
+            lf = lf.filter(pl.col("Governorate").is_in(list(govs)))
+        return lf
+
+    def gov_agg(self) -> pd.DataFrame:
+        commercial = pl.sum_horizontal(COMMERCIAL_SIZE_COLS)
+        plan = (
+            self._lazy()
+            .group_by("Governorate")
+            .agg(*[pl.col(c).sum().cast(pl.Int64) for c in COUNT_COLS], pl.len().cast(pl.Int64).alias("Towns"))
+            .with_columns(commercial.alias("Commercial (total)"))
+            .with_columns((pl.col("Commercial (total)") + pl.sum_horizontal(OTHER_COLS)).alias("All total"))
+            # ties keep governorate order, as the stable sort after groupby does
+            .sort(["All total", "Governorate"], descending=[True, False])
+            .select(GOV_AGG_COLS)
+        )
+        return plan.collect().to_pandas()
+
+    def existence_counts(self, govs=None) -> pd.DataFrame:
+        # one group by for both counts of every activity, then each count is
+        # unpivoted to long form and the two are joined, all in the same plan
+        wide = self._lazy(govs).group_by("Governorate").agg(
+            *[(pl.col(c) == 1).sum().cast(pl.Int64).alias(f"NumTowns|{c}") for c in EXISTENCE_COLS],
+            *[pl.col(c).count().cast(pl.Int64).alias(f"Denom|{c}") for c in EXISTENCE_COLS],
+        )
+
+        def long(stat: str) -> pl.LazyFrame:
+            return wide.select(
+                "Governorate", *[pl.col(f"{stat}|{c}").alias(c) for c in EXISTENCE_COLS]
+            ).unpivot(index="Governorate", variable_name="ActivityRaw", value_name=stat)
+
+        plan = (
+            long("NumTowns")
+            .join(long("Denom"), on=["Governorate", "ActivityRaw"])
+            .sort(["Governorate", "ActivityRaw"])
+            .with_columns(
+                pl.col("ActivityRaw").replace_strict(EXISTENCE_LABELS, return_dtype=pl.String).alias("Activity"),
+                pl.col("NumTowns").alias("Value"),
+            )
+        )
+        return plan.collect().to_pandas()
+
+    def towns(self, gov: str, label: str) -> tuple:
+        # sorted, de-duplicated towns of `gov` where the activity exists
+        col = {lab: c for c, lab in EXISTENCE_LABELS.items()}[label]
+        present = self._lazy([gov]).filter(pl.col(col) == 1)
+        found = present.select("Town").drop_nulls().unique().sort("Town").collect()
+        return tuple(found["Town"].to_list())
+
+    def sources(self, gov: str, label: str) -> pd.DataFrame:
+        # provenance of the rows behind towns(gov, label), scanned from the
+        # files on request: only the matching rows' strings are materialized
+        col = {lab: c for c, lab in EXISTENCE_LABELS.items()}[label]
+        plan = (
+            self._raw()
+            .filter((self._governorate() == gov) & (_number(col) == 1))
+            .select(pl.col("Town").cast(pl.String), *[pl.col(c).cast(pl.String) for c in self.provenance])
+            .sort("Town", maintain_order=True)
+        )
+        return plan.collect().to_pandas()
+
+    def town_lookup(self) -> TownLookup:
+        return TownLookup(self)
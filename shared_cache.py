@@ -0,0 +1,345 @@
+# Cache shared between dashboard replicas, underneath streamlit's per-process
+# caches: loaded frames and aggregate tables are stored as Parquet, built
+# figures as plotly JSON. A backend only stores bytes under string keys and
+# keeps itself under a size limit by evicting the least recently used entries.
+#
+#   DASHBOARD_SHARED_CACHE=memory                 # this process only
+#   DASHBOARD_SHARED_CACHE=disk:/srv/dash-cache   # replicas on one host / volume
+#   DASHBOARD_SHARED_CACHE=redis://localhost:6379/0
+#   DASHBOARD_SHARED_CACHE_MB=512                 # size limit (default 256)
+#
+# The Redis backend enforces the size limit on its own keys and leaves the
+# server's settings alone. On a server dedicated to the cache, also set
+# `maxmemory` (a little above the limit) and `maxmemory-policy allkeys-lru`
+# in its configuration, so the server stays bounded if replicas race.
+#
+# Filter-dependent results (one entry per governorate selection x top N x
+# toggles) go to a bounded in-process MemoryBackend, sized with
+#   DASHBOARD_FILTER_CACHE_MB=64 DASHBOARD_FILTER_CACHE_ENTRIES=256
+#   DASHBOARD_FILTER_CACHE_POLICY=lru | lfu
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from pipeline import CACHE_DIR, SNAPSHOT_VERSION
+
+ENV_BACKEND = "DASHBOARD_SHARED_CACHE"
+ENV_MAX_MB = "DASHBOARD_SHARED_CACHE_MB"
+DEFAULT_MAX_MB = 256
+ENV_FILTER_MB = "DASHBOARD_FILTER_CACHE_MB"
+ENV_FILTER_ENTRIES = "DASHBOARD_FILTER_CACHE_ENTRIES"
+ENV_FILTER_POLICY = "DASHBOARD_FILTER_CACHE_POLICY"
+
+logger = logging.getLogger("dashboard.shared_cache")
+
+
+# === BACKENDS ================================================================
+class MemoryBackend:
+    # in-process, bounded by bytes and optionally entries; evicts the least
+    # recently ("lru") or least frequently ("lfu", ties by recency) used entry
+    def __init__(self, max_bytes: int, max_entries: int = None, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"unknown eviction policy {policy!r}")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self._items = OrderedDict()  # least recently used first
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            self._uses[key] += 1
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            uses = self._uses.pop(key, 0)
+            # make room first: the entry being added is never the one evicted
+            # (with LFU it has the fewest uses, so it would always lose)
+            while self._items and (
+                self.size + len(value) > self.max_bytes
+                or (self.max_entries and len(self._items) >= self.max_entries)
+            ):
+                self._evict_one()
+            self._items[key] = value
+            self._uses[key] = uses
+            self.size += len(value)
+
+    def _evict_one(self) -> None:
+        if self.policy == "lru":
+            key = next(iter(self._items))
+        else:
+            key = min(self._items, key=self._uses.__getitem__)  # first minimum = least recent
+        self.size -= len(self._items.pop(key))
+        del self._uses[key]
+        self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._uses.clear()
+            self.size = 0
+
+
+class DiskBackend:
+    # one file per key; a hit touches the file, so mtime order is LRU order
+    # for every process sharing the directory. Hits, misses and evictions are
+    # this process's; entries and bytes are the directory's.
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            value = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(value)
+        os.replace(tmp, path)  # atomic: other replicas never read a partial entry
+        self._evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for path in self.directory.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # evicted by another process meanwhile
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        with self._lock:
+            return {
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.bin"):
+            path.unlink(missing_ok=True)
+
+
+class RedisBackend:
+    # any server speaking the Redis protocol (redis, valkey, a local stand-in
+    # such as fakeredis via `client=`). The server may be shared with other
+    # applications, so it is never reconfigured: this backend keeps its own
+    # keys under the size limit, with their sizes in a hash and their last
+    # use in a sorted set (both under the prefix), evicting the least
+    # recently used first. Like the disk backend's, its stats count this
+    # process's hits, misses and evictions over the server's entries.
+    def __init__(self, url: str, max_bytes: int, prefix: str = "dashboard:", client=None):
+        if client is None:
+            import redis  # optional dependency: pip install redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self._sizes = prefix + "_sizes"  # key -> bytes
+        self._recency = prefix + "_recency"  # key -> last use (time.time())
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        if value is not None:
+            self.client.zadd(self._recency, {key: time.time()})
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, value)
+        pipe.hset(self._sizes, key, len(value))
+        pipe.zadd(self._recency, {key: time.time()})
+        pipe.execute()
+        self._evict()
+
+    def _evict(self) -> None:
+        # replicas may evict concurrently: a key popped twice only counts once
+        total = sum(int(size) for size in self.client.hvals(self._sizes))
+        while total > self.max_bytes:
+            popped = self.client.zpopmin(self._recency)
+            if not popped:
+                break
+            key = popped[0][0]
+            key = key.decode() if isinstance(key, bytes) else key
+            size = self.client.hget(self._sizes, key)
+            pipe = self.client.pipeline()
+            pipe.delete(self.prefix + key)
+            pipe.hdel(self._sizes, key)
+            pipe.execute()
+            total -= int(size or 0)
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        sizes = self.client.hvals(self._sizes)
+        with self._lock:
+            return {
+                "entries": len(sizes),
+                "bytes": sum(int(size) for size in sizes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+# === CODECS ==================================================================
+def _frame_to_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_parquet(buf)  # keeps categoricals, unsigned counts and the index
+    return buf.getvalue()
+
+
+def _frame_from_bytes(raw: bytes) -> pd.DataFrame:
+    return pd.read_parquet(io.BytesIO(raw))
+
+
+def _figure_to_bytes(fig) -> bytes:
+    return fig.to_json().encode()
+
+
+def _figure_from_bytes(raw: bytes):
+    import plotly.io as pio
+
+    return pio.from_json(raw.decode())
+
+
+CODECS = {
+    "frame": (_frame_to_bytes, _frame_from_bytes),
+    "figure": (_figure_to_bytes, _figure_from_bytes),
+}
+
+
+# === SHARED CACHE ============================================================
+class SharedCache:
+    def __init__(self, backend, version: str = f"v{SNAPSHOT_VERSION}"):
+        self.backend = backend
+        self.version = version  # part of every key: bump to drop old entries
+
+    def key(self, kind: str, key: tuple) -> str:
+        digest = hashlib.sha256(repr((self.version, kind, key)).encode()).hexdigest()
+        return f"{kind}-{digest[:32]}"
+
+    def get_or_build(self, kind: str, key: tuple, build):
+        # `kind` picks the codec; a broken or unreachable backend only costs
+        # the shared hit, the value is then built locally as before
+        encode, decode = CODECS[kind]
+        name = self.key(kind, key)
+        try:
+            raw = self.backend.get(name)
+            if raw is not None:
+                return decode(raw)
+        except Exception:
+            logger.warning("shared cache read failed for %s", name, exc_info=True)
+        value = build()
+        try:
+            self.backend.set(name, encode(value))
+        except Exception:
+            logger.warning("shared cache write failed for %s", name, exc_info=True)
+        return value
+
+
+def from_env():
+    # the SharedCache configured by DASHBOARD_SHARED_CACHE, or None when unset
+    spec = os.environ.get(ENV_BACKEND, "").strip()
+    if not spec:
+        return None
+    max_bytes = int(float(os.environ.get(ENV_MAX_MB, DEFAULT_MAX_MB)) * 2**20)
+    if spec == "memory":
+        backend = MemoryBackend(max_bytes)
+    elif spec == "disk" or spec.startswith("disk:"):
+        backend = DiskBackend(spec[5:] or CACHE_DIR / "shared", max_bytes)
+    elif spec.startswith(("redis://", "rediss://", "unix://")):
+        backend = RedisBackend(spec, max_bytes)
+    else:
+        raise ValueError(f"{ENV_BACKEND}: unknown backend {spec!r}")
+    return SharedCache(backend)
+
+
+def filter_cache_from_env() -> SharedCache:
+    # the bounded cache for filter-dependent results; always on
+    backend = MemoryBackend(
+        int(float(os.environ.get(ENV_FILTER_MB, 64)) * 2**20),
+        int(os.environ.get(ENV_FILTER_ENTRIES, 256)) or None,
+        os.environ.get(ENV_FILTER_POLICY, "lru").strip().lower(),
+    )
+    return SharedCache(backend)
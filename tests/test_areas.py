@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import CSV_PATH, clean_area, normalize_areas, read_columns
+
+
+def row_wise(ref_area: pd.Series) -> pd.Series:
+    # what parse_csv did before normalize_areas
+    return ref_area.apply(clean_area).astype("category").rename("Governorate")
+
+
+def test_matches_row_wise_apply():
+    ref_area = pd.Series([
+        "https://dbpedia.org/page/Akkar_Governorate",
+        "http://dbpedia.org/resource/Matn_District",
+        "https://dbpedia.org/page/Baalbek-Hermel_Governorate",
+        "http://dbpedia.org/resource/Matn_District",
+        "Beirut",
+    ], index=[10, 11, 12, 13, 14], dtype=object)
+    pd.testing.assert_series_equal(normalize_areas(ref_area), row_wise(ref_area))
+
+
+def test_missing_area_cleans_like_nan():
+    # read_csv gives NaN for a blank refArea
+    ref_area = pd.Series(["http://dbpedia.org/resource/Tyre_District", np.nan, np.nan], dtype=object)
+    result = normalize_areas(ref_area)
+    assert result.tolist() == ["Tyre District", "Nan Governorate", "Nan Governorate"]
+    pd.testing.assert_series_equal(result, row_wise(ref_area))
+
+
+def test_urls_with_the_same_label_share_one_category():
+    ref_area = pd.Series([
+        "https://dbpedia.org/page/North_Governorate",
+        "http://dbpedia.org/resource/North_Governorate",
+        "North Governorate",
+    ])
+    result = normalize_areas(ref_area)
+    assert list(result.cat.categories) == ["North Governorate"]
+    assert (result == "North Governorate").all()
+
+
+def test_empty():
+    result = normalize_areas(pd.Series([], dtype=object))
+    assert result.empty and result.dtype == "category"
+
+
+@pytest.mark.skipif(not CSV_PATH.exists(), reason="needs Cleaned Data.csv")
+def test_real_file():
+    ref_area = read_columns(CSV_PATH, ["refArea"])["refArea"]
+    pd.testing.assert_series_equal(normalize_areas(ref_area), row_wise(ref_area))
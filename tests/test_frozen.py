@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from generate_data import write
+from pipeline import (
+    COMMERCIAL_SIZE_COLS,
+    EXISTENCE_COLS,
+    aggregate_governorates,
+    build_town_index,
+    existence_counts,
+    filter_agg,
+    filter_existence,
+    filter_towns,
+    freeze,
+    load_frame,
+    v1_long,
+)
+
+
+@pytest.fixture(scope="module")
+def frame(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("frozen")
+    csv_path = write(tmp / "data.csv", rows=2000, nan_rate=0.1)
+    return freeze(load_frame(csv_path, tmp / "cache"))
+
+
+def test_reruns_leave_the_frame_unchanged(frame):
+    before = frame.copy(deep=True)
+    gov_agg = aggregate_governorates(frame)
+    govs = sorted(gov_agg["Governorate"])
+    for top_n in (5, 25):
+        agg = filter_agg(gov_agg, govs[::2], top_n)
+        for show_pct, split in [(True, True), (True, False), (False, True), (False, False)]:
+            v1_long(agg, show_pct, split)
+        top_govs = agg["Governorate"].tolist()
+        filter_existence(existence_counts(frame), top_govs)
+        existence_counts(filter_towns(frame, top_govs))
+    build_town_index(frame)
+    pd.testing.assert_frame_equal(frame, before)
+
+
+@pytest.mark.parametrize("column", [
+    COMMERCIAL_SIZE_COLS[0],  # unsigned int
+    EXISTENCE_COLS[0],  # nullable Int8
+    "Governorate",  # categorical
+    "Town",  # string
+])
+def test_writes_raise(frame, column):
+    value = frame[column].iloc[1]
+    with pytest.raises(ValueError, match="read-only"):
+        frame.loc[0, column] = value
+    with pytest.raises(ValueError, match="read-only"):
+        frame[column].array[0] = value
+    with pytest.raises(ValueError, match="read-only"):
+        frame[column] = frame[column]
+
+
+@pytest.mark.parametrize("change", [
+    lambda df: df.__setitem__("Extra", 1),
+    lambda df: df.loc.__setitem__((slice(None), "Extra"), 1),
+    lambda df: df.insert(0, "Extra", 1),
+    lambda df: df.drop(columns="Town", inplace=True),
+    lambda df: df.pop("Town"),
+    lambda df: df.__delitem__("Town"),
+    lambda df: df.rename(columns={"Town": "Village"}, inplace=True),
+    lambda df: setattr(df, "columns", [f"c{i}" for i in range(df.shape[1])]),
+], ids=["setitem", "loc", "insert", "drop", "pop", "del", "rename", "columns"])
+def test_column_changes_raise(frame, change):
+    columns = list(frame.columns)
+    with pytest.raises(ValueError, match="read-only"):
+        change(frame)
+    assert list(frame.columns) == columns
+
+
+def test_derived_frames_are_writable(frame):
+    derived = frame.drop(columns="Town")
+    assert type(derived) is pd.DataFrame
+    derived["Extra"] = 1
+    assert "Extra" not in frame.columns
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from pipeline import discover_partitions, partition_path
+
+DATASET = "http://linked.aub.edu.lb/CODEC/Lebanon/Dataset/Trade-Lebanon-2024"
+
+
+def write(path):
+    path.parent.mkdir(parents=True)
+    pd.DataFrame({"Town": ["A"]}).to_csv(path, index=False)
+
+
+def test_discovers_partitions(tmp_path):
+    write(partition_path(tmp_path, 2024, DATASET))
+    (part,) = discover_partitions(tmp_path, tmp_path / "missing.csv")
+    assert (part.year, part.dataset) == (2024, DATASET)
+
+
+def test_skips_directories_that_are_not_partitions(tmp_path, caplog):
+    write(partition_path(tmp_path, 2024, DATASET))
+    write(tmp_path / "year=tmp" / f"dataset={DATASET.rsplit('/', 1)[-1]}" / "data.csv")
+    parts = discover_partitions(tmp_path, tmp_path / "missing.csv")
+    assert [p.year for p in parts] == [2024]
+    assert "year=tmp" in caplog.text
@@ -0,0 +1,146 @@
+import gc
+import weakref
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import pipeline
+from generate_data import write
+from pipeline import TownLookup, build_town_index, file_stamp, load_frame, merge_town_indexes, query_source
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return write(tmp_path / "data.csv", rows=300, nan_rate=0.1)
+
+
+@pytest.fixture(autouse=True)
+def no_open_sources(monkeypatch):
+    monkeypatch.setattr(pipeline, "_sources", {})
+    monkeypatch.setattr(pipeline, "_loaded", {})
+
+
+def test_one_source_per_file_version(csv_path):
+    pytest.importorskip("duckdb")
+    stamp = file_stamp(csv_path)
+    source = query_source("duckdb", csv_path, stamp)
+    assert query_source("duckdb", csv_path, stamp) is source
+    assert query_source("duckdb", str(csv_path), stamp) is source
+
+
+def append_row(csv_path):
+    with open(csv_path, "a") as f:
+        f.write(csv_path.read_text().splitlines()[1] + "\n")
+    return file_stamp(csv_path)
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    # stands in for the backends: each open records the rows it read
+    opened = []
+
+    def open_source(backend, paths, **options):
+        source = SimpleNamespace(rows=len(paths[0].read_text().splitlines()) - 1)
+        opened.append(source)
+        return source
+
+    monkeypatch.setattr(pipeline, "open_source", open_source)
+    return opened
+
+
+def test_an_older_stamp_never_replaces_a_newer_source(csv_path, opened):
+    old = file_stamp(csv_path)
+    before = query_source("fake", csv_path, old)
+    new = append_row(csv_path)
+    after = query_source("fake", csv_path, new)
+    assert query_source("fake", csv_path, old) is before
+    assert query_source("fake", csv_path, new) is after
+    assert len(opened) == 2 and (before.rows, after.rows) == (300, 301)
+
+
+def test_a_stamp_no_longer_on_disk_gets_the_current_source(csv_path, opened):
+    old = file_stamp(csv_path)
+    new = append_row(csv_path)
+    source = query_source("fake", csv_path, old)
+    assert source.rows == 301
+    assert query_source("fake", csv_path, new) is source
+    assert old not in pipeline._sources[("fake", csv_path.resolve())]
+    assert len(opened) == 1
+
+
+def test_only_the_previous_version_is_kept(csv_path):
+    pytest.importorskip("duckdb")
+    first = weakref.ref(query_source("duckdb", csv_path, file_stamp(csv_path)))
+    previous = query_source("duckdb", csv_path, append_row(csv_path))
+    new = query_source("duckdb", csv_path, append_row(csv_path))
+    gc.collect()
+    assert first() is None
+    assert list(pipeline._sources[("duckdb", csv_path.resolve())].values()) == [previous, new]
+    assert new.gov_agg()["Towns"].sum() == 302
+
+
+def test_town_lookup_merges_partitions(tmp_path):
+    pytest.importorskip("duckdb")
+    paths = [write(tmp_path / f"{year}.csv", rows=200, seed=year) for year in (2023, 2024)]
+    lookup = TownLookup(*[query_source("duckdb", p, file_stamp(p)) for p in paths])
+    expected = merge_town_indexes([build_town_index(load_frame(p, tmp_path / "cache")) for p in paths])
+    for key, towns in expected.items():
+        assert lookup.get(key) == towns
+    assert lookup.get(("Nowhere Governorate", "Commerce")) == ()
+
+
+
+def test_town_lookup_counts_towns_like_the_summed_counts(tmp_path):
+    # the same towns in two years: listed once, counted once per year
+    paths = [write(tmp_path / f"{year}.csv", rows=200, nan_rate=0.1) for year in (2023, 2024)]
+    sources = [query_source("pandas", p, file_stamp(p), cache_dir=tmp_path / "cache") for p in paths]
+    lookup = TownLookup(*sources)
+    summed = pipeline.combine_existence_counts([s.existence_counts() for s in sources])
+    for row in summed.itertuples():
+        key = (row.Governorate, row.Activity)
+        assert lookup.count(key) == row.NumTowns == 2 * len(lookup.get(key))
+
+@pytest.fixture(params=["pandas", "duckdb", "polars"])
+def backend(request):
+    if request.param != "pandas":
+        pytest.importorskip(request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_backends_answer_like_pandas(backend, tmp_path, suffix):
+    if backend == "pandas" and suffix == ".parquet":
+        pytest.skip("the pandas source loads CSV partitions")
+    path = write(tmp_path / f"data{suffix}", rows=500, nan_rate=0.1)
+    options = {"cache_dir": tmp_path / "cache"} if backend == "pandas" else {}
+    source = pipeline.open_source(backend, [path], **options)
+    csv = path if suffix == ".csv" else write(tmp_path / "data.csv", rows=500, nan_rate=0.1)
+    df = load_frame(csv, tmp_path / "cache")
+
+    def plain(table):
+        return table.astype({"Governorate": str}).reset_index(drop=True)
+
+    expected_agg = pipeline.aggregate_governorates(df)
+    pd.testing.assert_frame_equal(plain(source.gov_agg()), plain(expected_agg), check_dtype=False)
+    expected_exist = pipeline.existence_counts(df)
+    pd.testing.assert_frame_equal(plain(source.existence_counts()), plain(expected_exist), check_dtype=False)
+    govs = expected_agg["Governorate"].head(3).tolist()
+    pd.testing.assert_frame_equal(
+        plain(source.existence_counts(govs)),
+        plain(pipeline.filter_existence(expected_exist, govs)),
+        check_dtype=False,
+    )
+    index = build_town_index(df)
+    lookup = source.town_lookup()
+    assert all(lookup.get(key) == towns for key, towns in index.items())
+
+    gov, label = next(iter(index))
+    found = source.sources(gov, label)
+    assert list(found.columns) == ["Town"] + pipeline.PROVENANCE_COLS
+    assert sorted(found["Town"]) == list(found["Town"]) and set(found["Town"]) == set(index[(gov, label)])
+
+
+def test_pandas_snapshots_go_to_cache_dir(csv_path, tmp_path):
+    pipeline.open_source("pandas", [csv_path], cache_dir=tmp_path / "cache")
+    assert sorted(p.name.rsplit(".", 3)[-2] for p in (tmp_path / "cache").iterdir()) == ["exist", "frame", "gov"]
@@ -0,0 +1,58 @@
+import tracemalloc
+
+import pytest
+
+from generate_data import write
+from pipeline import (
+    EXISTENCE_LABELS,
+    aggregate_governorates,
+    build_town_index,
+    existence_counts,
+    filter_towns,
+    filter_view,
+    freeze,
+    load_frame,
+    v1_long,
+)
+
+# a rerun may allocate at most this share of what copying the filtered
+# towns costs: it only slices tables that were aggregated at load time
+MAX_SLICE_SHARE = 0.1
+
+
+def peak_bytes(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture(scope="module")
+def loaded(tmp_path_factory):
+    # what the dashboard holds before any filter is applied
+    tmp = tmp_path_factory.mktemp("rerun")
+    df = freeze(load_frame(write(tmp / "data.csv", rows=100_000), tmp / "cache"))
+    return df, aggregate_governorates(df), existence_counts(df), build_town_index(df)
+
+
+@pytest.mark.parametrize("top_n", [5, 25])
+def test_rerun_allocates_a_fraction_of_the_filtered_towns(loaded, top_n):
+    df, gov_agg, exist_counts, town_index = loaded
+    sel_govs = sorted(gov_agg["Governorate"])
+
+    def rerun():
+        # the script's path from the sidebar filters to the visuals' inputs
+        agg, top_govs, exist = filter_view(gov_agg, exist_counts, sel_govs, top_n)
+        v1_long(agg, True, True)
+        v1_long(agg, False, False)
+        return [town_index.get((gov, label), ()) for gov in top_govs for label in EXISTENCE_LABELS.values()]
+
+    top_govs = filter_view(gov_agg, exist_counts, sel_govs, top_n)[1]
+    slice_bytes = filter_towns(df, top_govs).memory_usage(deep=True).sum()
+    bound = MAX_SLICE_SHARE * slice_bytes
+
+    # the bound is one the old path (count over a copy of the towns) breaks
+    assert peak_bytes(lambda: existence_counts(filter_towns(df, top_govs))) > bound
+    assert peak_bytes(rerun) <= bound
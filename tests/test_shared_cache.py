@@ -0,0 +1,127 @@
+import json
+import os
+
+import pandas as pd
+import plotly.express as px
+import pytest
+
+from shared_cache import DiskBackend, MemoryBackend, RedisBackend, SharedCache
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_memory_admits_new_entries_when_full(policy):
+    backend = MemoryBackend(1000, max_entries=3, policy=policy)
+    for key in "abc":
+        backend.set(key, key.encode())
+        backend.get(key)
+    backend.set("d", b"d")
+    assert backend.get("d") == b"d"
+    assert backend.stats()["entries"] == 3 and backend.evictions == 1
+
+
+def test_memory_lfu_evicts_the_least_used():
+    backend = MemoryBackend(1000, max_entries=2, policy="lfu")
+    backend.set("a", b"a")
+    backend.set("b", b"b")
+    for key in "aaabb":
+        backend.get(key)  # a: 3 uses, b: 2 but more recent: b goes
+    backend.set("c", b"c")
+    assert backend.get("b") is None and backend.get("a") == b"a"
+
+
+def test_memory_lru_respects_the_byte_limit():
+    backend = MemoryBackend(10, policy="lru")
+    backend.set("a", b"x" * 6)
+    backend.set("b", b"x" * 6)
+    assert backend.get("a") is None and backend.size == 6
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis()
+
+
+def test_redis_leaves_the_server_config_alone(redis_client, monkeypatch):
+    # the server may be shared: CONFIG SET would change it for everyone
+    def config_set(*args):
+        raise AssertionError("server reconfigured")
+
+    monkeypatch.setattr(redis_client, "config_set", config_set)
+    backend = RedisBackend("", 1000, client=redis_client)
+    backend.set("a", b"a" * 100)
+    assert backend.get("a") == b"a" * 100
+
+
+def test_redis_evicts_its_least_recently_used_keys(redis_client):
+    backend = RedisBackend("", 250, client=redis_client)
+    redis_client.set("other-app", b"x" * 1000)  # not ours: never evicted
+    backend.set("a", b"a" * 100)
+    backend.set("b", b"b" * 100)
+    assert backend.get("a") == b"a" * 100  # b is now the least recently used
+    backend.set("c", b"c" * 100)
+    assert backend.get("b") is None
+    assert backend.get("a") is not None and backend.get("c") is not None
+    assert redis_client.get("other-app") == b"x" * 1000
+
+
+def test_redis_skips_values_over_the_limit(redis_client):
+    backend = RedisBackend("", 50, client=redis_client)
+    backend.set("big", b"x" * 100)
+    assert backend.get("big") is None
+
+
+def test_disk_evicts_the_least_recently_used(tmp_path):
+    backend = DiskBackend(tmp_path, 250)
+    backend.set("a", b"a" * 100)
+    backend.set("b", b"b" * 100)
+    # mtime order is the LRU order: age both, then a hit makes a the newest
+    for age, key in ((2, "a"), (1, "b")):
+        os.utime(backend._path(key), ns=(age * 10**9, age * 10**9))
+    assert backend.get("a") == b"a" * 100
+    backend.set("c", b"c" * 100)
+    assert backend.get("b") is None
+    assert backend.get("a") is not None and backend.get("c") is not None
+    assert backend.stats()["evictions"] == 1
+
+
+def test_disk_skips_values_over_the_limit(tmp_path):
+    backend = DiskBackend(tmp_path, 50)
+    backend.set("big", b"x" * 100)
+    assert backend.get("big") is None and backend.stats()["entries"] == 0
+
+
+@pytest.fixture(params=["memory", "disk", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(2**20)
+    if request.param == "disk":
+        return DiskBackend(tmp_path / "shared", 2**20)
+    return RedisBackend("", 2**20, client=request.getfixturevalue("redis_client"))
+
+
+def test_stats_count_hits_and_misses(backend):
+    cache = SharedCache(backend)
+    frame = pd.DataFrame({"n": [1, 2]})
+    for key in ("a", "a", "a", "b"):
+        cache.get_or_build("frame", (key,), lambda: frame)
+    stats = backend.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 0)
+    assert stats["entries"] == 2 and stats["bytes"] > 0
+
+
+def test_codecs_round_trip(backend):
+    cache = SharedCache(backend)
+    frame = pd.DataFrame({
+        "Governorate": pd.Categorical(["Akkar Governorate", "Beirut Governorate"]),
+        "Commerce": pd.array([1, None], dtype="Int8"),
+        "Towns": pd.array([3, 4], dtype="uint16"),
+    }, index=[5, 7])
+    figure = px.bar(frame, x="Governorate", y="Towns")
+    for kind, value in (("frame", frame), ("figure", figure)):
+        cache.get_or_build(kind, ("k",), lambda: value)
+        cached = cache.get_or_build(kind, ("k",), lambda: pytest.fail("not served from the cache"))
+        if kind == "frame":
+            pd.testing.assert_frame_equal(cached, frame)
+        else:
+            assert json.loads(cached.to_json()) == json.loads(figure.to_json())
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image, features
+
+from pipeline import file_stamp, webp_thumbnail
+
+
+@pytest.fixture
+def png(tmp_path):
+    path = tmp_path / "logo.png"
+    Image.new("RGB", (1200, 300), "navy").save(path)
+    return path
+
+
+@pytest.mark.skipif(not features.check("webp"), reason="Pillow built without WebP")
+def test_thumbnail_is_webp(png, tmp_path):
+    out = Path(webp_thumbnail(png, 600, file_stamp(png), tmp_path / "cache"))
+    with Image.open(out) as im:
+        assert (im.format, im.size) == ("WEBP", (600, 150))
+
+
+def test_no_webp_encoder_serves_the_original(png, tmp_path, monkeypatch):
+    Image.init()  # registers the WebP plugin, if this build has one
+    monkeypatch.delitem(Image.SAVE, "WEBP", raising=False)
+    assert webp_thumbnail(png, 600, file_stamp(png), tmp_path / "cache") == str(png)
+    assert list((tmp_path / "cache").iterdir()) == []
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from pipeline import SingleFlight
+
+
+class Stopped(BaseException):
+    # stands in for streamlit's StopException / RerunException
+    pass
+
+
+def run_waiter(flight, key, build, out):
+    def target():
+        try:
+            out.append(flight.do(key, build))
+        except BaseException as exc:
+            out.append(exc)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    time.sleep(0.1)  # let it find the leader's flight and wait on it
+    return thread
+
+
+def test_waiters_share_one_build():
+    flight, release, calls, out = SingleFlight(), threading.Event(), [], []
+
+    def build():
+        calls.append(1)
+        release.wait()
+        return "frame"
+
+    leader = run_waiter(flight, "k", build, out)
+    waiters = [run_waiter(flight, "k", build, out) for _ in range(3)]
+    release.set()
+    for thread in [leader, *waiters]:
+        thread.join()
+    assert out == ["frame"] * 4 and len(calls) == 1
+
+
+def test_waiters_share_a_failure():
+    flight, release, out = SingleFlight(), threading.Event(), []
+
+    def build():
+        release.wait()
+        raise OSError("unreadable")
+
+    leader = run_waiter(flight, "k", build, out)
+    waiter = run_waiter(flight, "k", build, out)
+    release.set()
+    leader.join()
+    waiter.join()
+    assert [type(e) for e in out] == [OSError, OSError]
+
+
+def test_a_stopped_leader_does_not_stop_its_waiters():
+    flight, release, out = SingleFlight(), threading.Event(), []
+
+    def stopped_build():
+        release.wait()
+        raise Stopped()
+
+    leader = run_waiter(flight, "k", stopped_build, out)
+    waiter = run_waiter(flight, "k", lambda: "own build", out)
+    release.set()
+    leader.join()
+    waiter.join()
+    # the leader sees its own stop; the waiter builds again instead of
+    # receiving it
+    assert isinstance(out[0], Stopped) and out[1:] == ["own build"]
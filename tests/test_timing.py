@@ -0,0 +1,22 @@
+from timing import StageTimer
+
+
+def test_fragments_time_into_the_run_until_it_finishes():
+    timer = StageTimer(True, session="s")
+    with timer.for_fragment().stage("visual 1 figure"):
+        pass
+    timer.finish()
+    rerun = timer.for_fragment()
+    with rerun.stage("visual 1 figure"):
+        pass
+    assert [name for name, _ in timer.stages] == ["visual 1 figure"]
+    assert rerun is not timer and rerun.run != timer.run and rerun.session == "s"
+    assert len(rerun.stages) == 1
+
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer(False)
+    timer.finish()
+    with timer.for_fragment().stage("drill-down"):
+        pass
+    assert timer.stages == [] and not timer.for_fragment().enabled
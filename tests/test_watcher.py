@@ -0,0 +1,56 @@
+import pytest
+
+import watcher
+from pipeline import Partition
+from watcher import DataWatcher
+
+PART = Partition(2024, "dataset", "missing.csv")
+
+
+@pytest.fixture(autouse=True)
+def no_wait(monkeypatch):
+    monkeypatch.setattr(watcher, "FIRST_READ_DELAY", 0)
+
+
+def test_published_warms_first(monkeypatch):
+    monkeypatch.setattr(watcher, "file_stamp", lambda path: (1, 1))
+    warmed = []
+    w = DataWatcher(lambda parts, stamps: warmed.append(parts), interval=0, discover=lambda: [PART])
+    assert w.published() == ((PART,), {PART: (1, 1)})
+    assert warmed == [(PART,)]
+
+
+def test_published_retries_an_unreadable_first_version(monkeypatch):
+    calls = []
+
+    def stamp(path):
+        calls.append(path)
+        if len(calls) < 3:
+            raise FileNotFoundError(path)  # being replaced
+        return (1, 1)
+
+    monkeypatch.setattr(watcher, "file_stamp", stamp)
+    w = DataWatcher(lambda parts, stamps: None, interval=0, discover=lambda: [PART])
+    assert w.published() == ((PART,), {PART: (1, 1)})
+
+
+def test_published_raises_when_the_files_never_read(monkeypatch):
+    def stamp(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(watcher, "file_stamp", stamp)
+    w = DataWatcher(lambda parts, stamps: None, interval=0, discover=lambda: [PART])
+    with pytest.raises(RuntimeError, match="could not read the data files"):
+        w.published()
+
+
+def test_release_gets_the_replaced_version(monkeypatch):
+    stamps = iter([(1, 1), (2, 2)])
+    monkeypatch.setattr(watcher, "file_stamp", lambda path: next(stamps))
+    released = []
+    w = DataWatcher(lambda parts, stamps: None, interval=0, discover=lambda: [PART],
+                    release=lambda old, new: released.append((old, new)))
+    first = w.published()
+    second = w.published()
+    assert released == [(first, second)]
+    assert second[1] == {PART: (2, 2)}
@@ -0,0 +1,77 @@
+# Opt-in per-stage timing for dashboard.py. Turned on with the env var
+# DASHBOARD_TIMING=1 or the ?timing=1 query param; each finished stage is
+# written as one JSON line (to DASHBOARD_TIMING_LOG if set, else stderr)
+# and the dashboard shows the stages of the current run in a panel.
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+ENV_FLAG = "DASHBOARD_TIMING"
+ENV_LOG = "DASHBOARD_TIMING_LOG"
+
+logger = logging.getLogger("dashboard.timing")
+
+
+def _configure_logger() -> None:
+    if logger.handlers:
+        return
+    log_path = os.environ.get(ENV_LOG)
+    handler = logging.FileHandler(log_path) if log_path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def env_enabled() -> bool:
+    return os.environ.get(ENV_FLAG, "").lower() in ("1", "true", "yes")
+
+
+class StageTimer:
+    # One per script run. A disabled timer's stage() is a no-op, so the
+    # dashboard can wrap its sections unconditionally.
+    def __init__(self, enabled: bool, session: str = ""):
+        self.enabled = enabled
+        self.session = session
+        self.run = uuid.uuid4().hex[:8]
+        self.stages = []  # (stage, ms) in the order they finished
+        self.finished = False
+        if enabled:
+            _configure_logger()
+
+    def finish(self) -> None:
+        # the script run is over: what still gets timed is a fragment rerun
+        self.finished = True
+
+    def for_fragment(self) -> "StageTimer":
+        # a fragment is called again with the arguments of the full run that
+        # drew it: during that run its stages are the run's, on a fragment
+        # rerun they get a timer (and run id) of their own
+        return StageTimer(self.enabled, self.session) if self.finished else self
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.stages.append((name, ms))
+            logger.info(json.dumps({
+                "ts": round(time.time(), 3),
+                "session": self.session,
+                "run": self.run,
+                "stage": name,
+                "ms": round(ms, 3),
+                **fields,
+            }))
+
+    def total_ms(self) -> float:
+        return sum(ms for _, ms in self.stages)
@@ -0,0 +1,106 @@
+# Background watcher for the data files behind dashboard.py. A daemon thread
+# polls the partitions' file stamps; when they change it runs a warm-up
+# callback (loads, aggregates, default figures) off the request path and only
+# then publishes the new stamps, so sessions keep reading the previous,
+# already-cached version until the new one is ready.
+#
+# DASHBOARD_WATCH_INTERVAL sets the poll period in seconds (default 2);
+# 0 turns the thread off and every published() call checks inline instead.
+import logging
+import os
+import threading
+import time
+
+from pipeline import SingleFlight, discover_partitions, file_stamp
+
+ENV_INTERVAL = "DASHBOARD_WATCH_INTERVAL"
+THREAD_NAME = "data-watcher"
+FIRST_READ_TRIES = 5  # a file being replaced at startup: wait this many...
+FIRST_READ_DELAY = 0.2  # ...times this many seconds for it before giving up
+
+logger = logging.getLogger("dashboard.watcher")
+
+
+def env_interval() -> float:
+    try:
+        return float(os.environ.get(ENV_INTERVAL, 2.0))
+    except ValueError:
+        return 2.0
+
+
+def current_stamps(discover=discover_partitions) -> tuple:
+    # (partitions, {partition: file_stamp}) as they are on disk right now
+    partitions = tuple(discover())
+    return partitions, {p: file_stamp(p.path) for p in partitions}
+
+
+class DataWatcher:
+    def __init__(self, warm, interval: float = 2.0, discover=discover_partitions, release=None):
+        # warm(partitions, stamps) fills the caches for one version of the data;
+        # release(old, new) drops what only the replaced version still needs
+        self.warm = warm
+        self.release = release
+        self.interval = interval
+        self.discover = discover
+        self.warmed = 0  # versions published so far
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._published = None
+        self._error = None  # why the files could not be read, last time
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self) -> bool:
+        # warm and publish the files as they are now; True if that was a new
+        # version. Callers that see the same new version share one warm-up,
+        # and its failure.
+        try:
+            version = current_stamps(self.discover)
+        except OSError as exc:
+            self._error = exc
+            return False  # a file is being replaced: try again next tick
+        if version == self._published:
+            return False
+        key = (version[0], tuple(version[1].items()))
+        return self._flight.do(key, lambda: self._publish(version))
+
+    def _publish(self, version: tuple) -> bool:
+        with self._lock:  # different versions one after the other, in order
+            if version == self._published:
+                return False
+            self.warm(*version)
+            old, self._published = self._published, version  # readers see old or new
+            self.warmed += 1
+            if self.release is not None and old is not None:
+                self.release(old, version)
+            return True
+
+    def published(self) -> tuple:
+        # (partitions, stamps) of the last warmed version
+        if self._thread is None or self._published is None:
+            self.check()
+        for _ in range(FIRST_READ_TRIES - 1):
+            if self._published is not None:
+                break
+            time.sleep(FIRST_READ_DELAY)
+            self.check()
+        if self._published is None:
+            raise RuntimeError("could not read the data files") from self._error
+        return self._published
+
+    def start(self) -> "DataWatcher":
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=THREAD_NAME, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # keep serving the last good version; retried on the next tick
+                logger.exception("warming the data caches failed")